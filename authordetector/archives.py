@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package archives
+#
+# Read the texts directly from tar, zip and gzip archives, without extracting them on the disk.
+# A text inside an archive is designated by the path of the archive followed by the path of the member inside the archive (eg: corpus.tar.gz/authorA/text1.txt). A gzip file contains only one text (eg: text1.txt.gz).
+
+import os
+import tarfile
+import zipfile
+import gzip
+import threading
+
+# Extensions of the archives and their type
+extensions = [('.tar.gz', 'tar'), ('.tgz', 'tar'), ('.tar.bz2', 'tar'), ('.tbz2', 'tar'), ('.tar', 'tar'), ('.zip', 'zip'), ('.gz', 'gz')]
+
+## Return the type of archive of a path from its extension
+# @param path Path of a file
+# @return string 'tar', 'zip', 'gz' or None if it's not an archive
+def get_type(path):
+    path = path.lower()
+    for (ext, archivetype) in extensions:
+        if path.endswith(ext):
+            return archivetype
+    return None
+
+## Split the path of a text into the path of the archive containing it and the name of the member inside the archive
+# @param path Path of the text
+# @return tuple (archive path, member name or None for a gzip file), or None if the text is not inside an archive
+def split_path(path):
+    # Quick check without touching the disk: no part of the path looks like an archive
+    if not any(ext in path.lower() for (ext, archivetype) in extensions):
+        return None
+    if get_type(path) == 'gz' and os.path.isfile(path):
+        return (path, None)
+    head = path
+    parts = list()
+    while True:
+        (head, tail) = os.path.split(head)
+        if not tail:
+            return None
+        parts.insert(0, tail)
+        if get_type(head) in ('tar', 'zip') and os.path.isfile(head):
+            return (head, '/'.join(parts))
+
+## Normalize the name of a member of an archive, so that it can be compared with the paths in the textconfig
+def normalize(name):
+    name = name.replace('\\', '/')
+    while name.startswith('./'):
+        name = name[2:]
+    return name.lstrip('/')
+
+## TarArchive
+#
+# Read the members of a (compressed) tar archive sequentially, in the order of the archive: the archive is streamed from the beginning to the end, without ever seeking backwards (which is very slow with compressed archives since they must be decompressed again from the start).
+# The members asked after their turn are kept in memory when the stream goes past them, so that texts listed in a different order than the archive's are still read in only one pass (within the limit of buffersize).
+class TarArchive(object):
+
+    ## Constructor
+    # @param path Path of the archive
+    # @param buffersize Maximum total size in bytes of the members kept in memory in advance
+    def __init__(self, path, buffersize):
+        self.path = path
+        self.buffersize = buffersize
+        self.wanted = set() # members that will be read
+        self.buffer = dict() # members read in advance
+        self.buffered = 0 # total size of the buffer
+        self.sizes = dict() # sizes of the members seen so far
+        self.stream = None
+        self.passed = set() # members the stream went past
+        self.restarts = 0 # number of times the stream had to start again from the beginning
+        self.last = (None, None) # last member read (a text is often read twice in a row, eg: to hash it and then to preprocess it)
+
+    ## Read the next members of the stream until a given member is found
+    def _scan(self, member):
+        if self.stream is None:
+            self.stream = tarfile.open(self.path, 'r|*')
+            self.passed = set()
+        while True:
+            tarinfo = self.stream.next()
+            if tarinfo is None:
+                self.close()
+                return None
+            if not tarinfo.isfile():
+                continue
+            name = normalize(tarinfo.name)
+            self.sizes[name] = tarinfo.size
+            self.passed.add(name)
+            if name == member:
+                return self.stream.extractfile(tarinfo).read()
+            # Keep in memory the members that will be asked later
+            if name in self.wanted and name not in self.buffer and self.buffered + tarinfo.size <= self.buffersize:
+                self.buffer[name] = self.stream.extractfile(tarinfo).read()
+                self.buffered += tarinfo.size
+
+    ## Read a member
+    # @param member Name of the member
+    # @return string Content of the member
+    def read(self, member):
+        if self.last[0] == member:
+            return self.last[1]
+        if member in self.buffer:
+            data = self.buffer.pop(member)
+            self.buffered -= len(data)
+            self.last = (member, data)
+            return data
+        # The stream already went past this member: start again from the beginning of the archive
+        if self.stream is not None and member in self.passed:
+            self.close()
+            self.restarts += 1
+        midway = self.stream is not None
+        data = self._scan(member)
+        # Not found until the end: the member may be before the point where the stream was
+        if data is None and midway:
+            self.restarts += 1
+            data = self._scan(member)
+        if data is None:
+            raise IOError("No member %s in the archive %s" % (member, self.path))
+        self.last = (member, data)
+        return data
+
+    ## Return the size of a member (if it was already seen, else None)
+    def size(self, member):
+        return self.sizes.get(member)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+## ZipArchive
+#
+# Read the members of a zip archive (the members are compressed separately and indexed at the end of the archive, so they can be read in any order)
+class ZipArchive(object):
+
+    def __init__(self, path, buffersize):
+        self.path = path
+        self.zipfile = zipfile.ZipFile(path, 'r')
+        self.names = dict((normalize(name), name) for name in self.zipfile.namelist())
+        self.wanted = set()
+
+    def read(self, member):
+        if member not in self.names:
+            raise IOError("No member %s in the archive %s" % (member, self.path))
+        return self.zipfile.read(self.names[member])
+
+    def size(self, member):
+        if member not in self.names:
+            return None
+        return self.zipfile.getinfo(self.names[member]).file_size
+
+    def close(self):
+        self.zipfile.close()
+
+## GzipFile
+#
+# Read a text compressed with gzip
+class GzipFile(object):
+
+    def __init__(self, path, buffersize):
+        self.path = path
+        self.wanted = set()
+
+    def read(self, member=None):
+        f = gzip.open(self.path, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    def size(self, member=None):
+        return None
+
+    def close(self):
+        pass
+
+## ArchiveSet
+#
+# Keep the archives opened during the reading of the texts, one object per archive.
+# The archives are read under a lock (the texts may be read by several prefetch threads), and they are opened again in forked processes (the streams can't be shared with the parent).
+class ArchiveSet(object):
+
+    classes = {'tar': TarArchive, 'zip': ZipArchive, 'gz': GzipFile}
+
+    ## Constructor
+    # @param buffersize Maximum total size in bytes of the members read in advance, per tar archive
+    def __init__(self, buffersize=64*1024*1024):
+        self.buffersize = buffersize
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.archives = dict()
+        self.wanted = dict() # archive path -> set of members that will be read
+
+    ## Return the object to read an archive, opening it at the first call
+    def get(self, path):
+        if self.pid != os.getpid():
+            # Forked process: drop the parent's archives without closing them (the parent still uses them)
+            self.archives = dict()
+            self.pid = os.getpid()
+        if path not in self.archives:
+            archive = ArchiveSet.classes[get_type(path)](path, self.buffersize)
+            archive.wanted = self.wanted.get(path, set())
+            self.archives[path] = archive
+        return self.archives[path]
+
+    ## Declare the members that will be read, so that they can be kept when a tar stream goes past them
+    # @param path Path of the archive
+    # @param members List of members names
+    def want(self, path, members):
+        self.wanted.setdefault(path, set()).update(members)
+
+    ## Read a member of an archive
+    # @param path Path of the archive
+    # @param member Name of the member (None for a gzip file)
+    # @return string Content of the member
+    def read(self, path, member):
+        with self.lock:
+            return self.get(path).read(member)
+
+    ## Return the size of a member of an archive if it's known without reading it, else None
+    def size(self, path, member):
+        with self.lock:
+            return self.get(path).size(member)
+
+    ## Close all the archives
+    def close(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                for archive in self.archives.itervalues():
+                    archive.close()
+            self.archives = dict()
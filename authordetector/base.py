@@ -23,6 +23,18 @@
 # This contains the base classes that are used by most other classes (in subfolders)
 # Remember that the main function (eg: process() ) in your implemented class should return a dict of vars (eg: return {'X': var})
 
+import os
+
+## Return the size and modification time of a file, to know if it changed without reading it
+# @param path Path of the file
+# @return tuple (path, size, mtime), with None for the size and mtime if the file does not exist
+def stat_file(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (path, None, None)
+    return (path, st.st_size, st.st_mtime)
+
 ## BaseClass
 #
 # Base class for most other classes (in subfolders)
@@ -34,6 +46,21 @@ class BaseClass(object):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module, used to compute the key of the stages cache (so that changing another module's parameter does not invalidate the cached output of this module). None means the whole config.
+    configkeys = None
+
+    # Config keys whose values are paths of files read by this module (eg: a list of stopwords): the sizes and modification times of these files are part of the keys of the caches, so that editing a file invalidates the cached outputs (see get_config_files())
+    configfiles = []
+
+    # Config keys read by this module that change how it runs but not what it computes (eg: a number of workers), or that are accounted for elsewhere (the texts are in the reader's fingerprint). The runtime keys of all the modules (and of the Runner) are ignored by the modules whose configkeys is None (see get_runtime_keys()).
+    runtimekeys = []
+
+    # Can the output of this module be cached on disk? Set to False for modules that are cheap or whose main purpose is to print something.
+    cacheable = True
+
+    # Vars returned by the public method of this module, used by the workflow scheduler to find which modules depend on each other (the vars read are the named arguments of the method). None means unknown: the module is then never run concurrently with another one.
+    outputvars = None
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     # @param parent The parent class, so that a child class can access the parent class namespace (variables and methods) at any moment
@@ -64,4 +91,36 @@ class BaseClass(object):
         else:
             self.config = config
 
-        return True
\ No newline at end of file
+        return True
+
+    ## Return the values of the config keys read by this module (see configkeys), used to compute the keys of the caches
+    # @return list List of (key, value) tuples
+    def get_config_values(self, *args, **kwargs):
+        if self.configkeys is None:
+            runtimekeys = self.get_runtime_keys()
+            keys = sorted([key for key in self.config.config.iterkeys() if key not in runtimekeys])
+        else:
+            keys = self.configkeys
+        values = [(key, self.config.get(key)) for key in keys]
+        # The files read by this module can change without their paths changing
+        files = self.get_config_files()
+        if files:
+            values.append(('configfiles', [stat_file(path) for path in files]))
+        return values
+
+    ## Return the config keys that change how the routine is run but not what the modules compute: the runtimekeys of the Runner and of all the modules classes loaded
+    # @return set Set of config keys
+    def get_runtime_keys(self, *args, **kwargs):
+        keys = set(getattr(self.__dict__.get('parent', None), 'runtimekeys', None) or [])
+        classes = [BaseClass]
+        while classes:
+            cls = classes.pop()
+            keys.update(cls.__dict__.get('runtimekeys', []))
+            classes.extend(cls.__subclasses__())
+        return keys
+
+    ## Return the paths of the files read by this module that are given in its config (see configfiles)
+    # The modules that read other files (eg: files found from the config values) can override this
+    # @return list List of paths
+    def get_config_files(self, *args, **kwargs):
+        return [self.config.get(key) for key in self.configfiles if self.config.get(key)]
\ No newline at end of file
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package checkpoint
+#
+# Save the vars after each stage of a long routine, so that an interrupted routine can be resumed at the first incomplete stage
+
+from authordetector import parallel
+import os, sys
+import cPickle as pickle
+import multiprocessing
+import tempfile
+import threading
+
+## Checkpoint
+#
+# Save asynchronously the vars and the list of the stages done into a binary file (pickle).
+# The writing is done in a forked process, which gets a consistent snapshot of the vars for free (copy-on-write), so the routine can go on modifying them right away. If we can't fork (Windows), the vars are serialized in memory first and then written by a thread.
+# Only one write is pending at a time: saving a new checkpoint waits for the previous one to be written.
+class Checkpoint(object):
+
+    ## @var path
+    # Path of the checkpoint file
+
+    ## Constructor
+    # @param path Path of the checkpoint file
+    def __init__(self, path):
+        self.path = path
+        self.writer = None # process or thread currently writing the checkpoint
+
+    ## Write a serialized checkpoint into the file, atomically (the file is never left half-written, even if we crash while writing)
+    @staticmethod
+    def _write_data(path, data):
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmppath = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if os.path.exists(path): # os.rename() cannot overwrite on Windows
+                os.remove(path)
+            os.rename(tmppath, path)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    ## Serialize and write a checkpoint (in the forked process)
+    @staticmethod
+    def _write(path, state):
+        Checkpoint._write_data(path, pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+
+    ## Save a checkpoint asynchronously
+    # @param signature Signature of the routine (a checkpoint is only reloaded by the same routine, see load())
+    # @param done Indexes of the stages done
+    # @param dictofvars Dict of the vars after these stages
+    def save(self, signature, done, dictofvars):
+        self.wait()
+        state = {'signature': signature, 'done': sorted(done), 'vars': dictofvars}
+        if parallel.can_fork():
+            sys.stdout.flush() # flush before forking, else the buffered output will be printed twice
+            self.writer = multiprocessing.Process(target=Checkpoint._write, args=(self.path, state))
+        else:
+            self.writer = threading.Thread(target=Checkpoint._write_data, args=(self.path, pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+        self.writer.start()
+
+    ## Wait for the pending checkpoint to be written
+    # @return bool False if the writing failed
+    def wait(self):
+        if self.writer is None:
+            return True
+        self.writer.join()
+        success = getattr(self.writer, 'exitcode', 0) == 0
+        if not success:
+            print("WARNING: could not write the checkpoint %s (exit code %s)." % (self.path, self.writer.exitcode))
+        self.writer = None
+        return success
+
+    ## Load the checkpoint
+    # @param signature Signature of the current routine: the checkpoint is ignored if it was saved by another routine (other modules, config or texts)
+    # @return tuple (set of indexes of the stages done, dict of vars), or None if there is no checkpoint matching the signature
+    def load(self, signature):
+        self.wait()
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except (IOError, OSError, EOFError, RuntimeError, pickle.UnpicklingError), e:
+            print("No checkpoint could be loaded from %s (%s), starting from the beginning." % (self.path, e))
+            return None
+        if state.get('signature') != signature:
+            print("WARNING: the checkpoint %s was saved with another workflow, config or texts, starting from the beginning." % self.path)
+            return None
+        return (set(state['done']), state['vars'])
+
+    ## Remove the checkpoint file (eg: when the routine is complete)
+    def remove(self):
+        self.wait()
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -20,6 +20,7 @@
 
 from auxlib import *
 from collections import OrderedDict
+import re
 
 json = import_module('ujson')
 if json is None:
@@ -122,61 +123,11 @@ class ConfigParser(object):
         return self.config.update(*args, **kwargs)
 
     ## Filter efficiently Javascript-like inline and multiline comments from a JSON file
-    # Author: WizKid https://gist.github.com/WizKid/1170297
+    # The text is split by the regexp engine into strings, code and comments, and only the strings and code are kept (so that comments markers inside strings are kept), instead of looping over each character in Python.
     # @param s string to filter
     # @return string filtered string without comments
     def _removecomments(self, s):
-        inCommentSingle = False
-        inCommentMulti = False
-        inString = False
-
-        t = []
-        l = len(s)
-
-        i = 0
-        fromIndex = 0
-        while i < l:
-            c = s[i]
-
-            if not inCommentMulti and not inCommentSingle:
-                if c == '"':
-                    slashes = 0
-                    for j in xrange(i - 1, 0, -1):
-                        if s[j] != '\\':
-                            break
-
-                        slashes += 1
-
-                    if slashes % 2 == 0:
-                        inString = not inString
-
-                elif not inString:
-                    if c == '#':
-                        inCommentSingle = True
-                        t.append(s[fromIndex:i])
-                    elif c == '/' and i + 1 < l:
-                        cn = s[i + 1]
-                        if cn == '/':
-                            inCommentSingle = True
-                            t.append(s[fromIndex:i])
-                            i += 1
-                        elif cn == '*':
-                            inCommentMulti = True
-                            t.append(s[fromIndex:i])
-                            i += 1
-
-            elif inCommentSingle and (c == '\n' or c == '\r'):
-                inCommentSingle = False
-                fromIndex = i
-
-            elif inCommentMulti and c == '*' and i + 1 < l and s[i + 1] == '/':
-                inCommentMulti = False
-                i += 1
-                fromIndex = i + 1
-
-            i += 1
-
-        if not inCommentSingle and not inCommentMulti:
-            t.append(s[fromIndex:len(s)])
+        return ''.join(_commentspat.findall(s))
 
-        return "".join(t)
+# Strings and code (group 1, kept), or single-line comments (# or //, the end of line is kept) and multiline comments (/* */)
+_commentspat = re.compile(r'((?:[^"/#]+|"(?:[^"\\]+|\\.)*"?|/(?![/*]))+)|(?:#|//)[^\r\n]*|/\*.*?(?:\*/|\Z)', re.S)
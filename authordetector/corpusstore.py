@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package corpusstore
+#
+# Binary store of the tokens streams of the texts (eg: the lemmas and grammatical categories returned by TreeTagger), compiled once and then reused by the next learning and detection runs without reading, preprocessing and tagging the texts again.
+# The store is a directory with two files:
+# - tokens.bin: the ids of the tokens of all the streams, as int32 concatenated one after the other (memory-mapped when reading)
+# - index.pkl: the vocabulary shared by all the streams (id -> token) and, for each text, the offset and the length of each of its streams in tokens.bin
+
+import os
+import tempfile
+import cPickle as pickle
+import numpy as np
+
+## CorpusStore
+#
+# Read and append the tokens streams of the texts. Each text is identified by a key, which must change when anything that changes its tokens changes (the text itself, the preprocessors, the features extractor and their config).
+class CorpusStore(object):
+
+    # Type of the ids in tokens.bin
+    dtype = np.int32
+
+    ## Constructor
+    # @param path Directory of the store (created when writing)
+    # @param write Open the store to add new texts (else it's read-only)
+    def __init__(self, path, write=False):
+        self.path = path
+        self.write = write
+        self.datafile = os.path.join(path, 'tokens.bin')
+        self.indexfile = os.path.join(path, 'index.pkl')
+        self.vocab = list() # id -> token
+        self.texts = dict() # key -> {stream name: (offset, length)}
+        self.end = 0 # number of ids stored
+        self.ids = None # token -> id (only built when writing)
+        self.tokens = None # memory-mapped ids (only when reading)
+        self.lookup = None # vocabulary as a numpy array of objects, to convert the ids back to tokens at once
+        self.out = None
+        if os.path.isfile(self.indexfile):
+            with open(self.indexfile, 'rb') as f:
+                data = pickle.load(f)
+            self.vocab = data['vocab']
+            self.texts = data['texts']
+            self.end = data['end']
+        if write:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.ids = dict((token, i) for i, token in enumerate(self.vocab))
+            self.out = open(self.datafile, 'ab')
+            # Drop the ids written after the last save of the index (interrupted compilation)
+            self.out.truncate(self.end * np.dtype(self.dtype).itemsize)
+            self.out.seek(0, os.SEEK_END)
+
+    ## Check if the store contains the streams of a text
+    def __contains__(self, key):
+        return key in self.texts
+
+    def __len__(self):
+        return len(self.texts)
+
+    ## Return the streams of a text
+    # @param key Key of the text
+    # @return dict Dict of lists of tokens (one per stream), or None if the text is not in the store
+    def get(self, key):
+        entry = self.texts.get(key)
+        if entry is None:
+            return None
+        if self.tokens is None and self.end > 0:
+            self.tokens = np.memmap(self.datafile, dtype=self.dtype, mode='r', shape=(self.end,))
+        if self.lookup is None or len(self.lookup) != len(self.vocab):
+            self.lookup = np.empty(len(self.vocab), dtype=object)
+            self.lookup[:] = self.vocab
+        streams = dict()
+        for (name, (offset, length)) in entry.iteritems():
+            if length == 0:
+                streams[name] = list()
+            else:
+                streams[name] = self.lookup[self.tokens[offset:offset+length]].tolist()
+        return streams
+
+    ## Add the streams of a text (the store must be opened for writing)
+    # @param key Key of the text
+    # @param streams Dict of lists of tokens (one per stream)
+    def add(self, key, streams):
+        if not self.write:
+            raise IOError("The corpus store %s is opened read-only" % self.path)
+        entry = dict()
+        for (name, stream) in streams.iteritems():
+            ids = np.empty(len(stream), dtype=self.dtype)
+            for i, token in enumerate(stream):
+                tid = self.ids.get(token)
+                if tid is None:
+                    tid = self.ids[token] = len(self.vocab)
+                    self.vocab.append(token)
+                ids[i] = tid
+            ids.tofile(self.out)
+            entry[name] = (self.end, len(ids))
+            self.end += len(ids)
+        self.texts[key] = entry
+
+    ## Write the index of the store (the ids added are only visible to the readers after this)
+    def save(self):
+        if not self.write:
+            return
+        self.out.flush()
+        os.fsync(self.out.fileno())
+        # Write in a temporary file and rename it, so that the index is never half-written
+        fd, tmppath = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'vocab': self.vocab, 'texts': self.texts, 'end': self.end}, f, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(self.indexfile): # os.rename() cannot overwrite on Windows
+                os.remove(self.indexfile)
+            os.rename(tmppath, self.indexfile)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+
+    ## Save the index and close the store
+    def close(self):
+        if self.out is not None:
+            self.save()
+            self.out.close()
+            self.out = None
+        self.tokens = None
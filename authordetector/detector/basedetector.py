@@ -48,6 +48,12 @@ class BaseDetector(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'detect'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['Result', 'Result_details']
+
+    # Detection is cheap and its results are printed, so it's not worth caching
+    cacheable = False
+
     constraints = {
         'after': 'patternsextractor'
     }
@@ -38,6 +38,9 @@ class CosineSimilarity(BaseDetector):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = []
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -60,8 +63,14 @@ class CosineSimilarity(BaseDetector):
                 A = P.ix[:,'freq']
                 B = LP.ix[:,'freq']
                 # Keep only the ngrams that are shared between the tables
-                A = A[A.index.isin(B.index)] # TODO: instead of this, try to append to B columns of A and set 0 to count?
-                B = B[B.index.isin(A.index)]
+                if A.index.is_unique and B.index.is_unique:
+                    # Lookup the ngrams of A in the index of the learned table: its hashtable is built once and kept with L_Patterns, so the cost only depends on the size of A
+                    pos = B.index.get_indexer(A.index)
+                    A = A[pos != -1]
+                    B = B.take(np.sort(pos[pos != -1])) # same as B[B.index.isin(A.index)], in the same order
+                else:
+                    A = A[A.index.isin(B.index)] # TODO: instead of this, try to append to B columns of A and set 0 to count?
+                    B = B[B.index.isin(A.index)]
                 cos = A.dot(B) / ( np.linalg.norm(A) * np.linalg.norm(B) ) # cosine similarity
                 Proba[idx][attr] = cos
 
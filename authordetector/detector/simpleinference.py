@@ -36,6 +36,9 @@ class SimpleInference(BaseDetector):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = []
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package diskcache
+#
+# Content-addressed on-disk cache of Python objects, with size-based LRU eviction
+
+import os
+import cPickle as pickle
+import hashlib
+import tempfile
+import threading
+
+## Small file-like object that feeds everything written to it into a hash, so that we can hash big objects without serializing them in memory first
+class HashWriter(object):
+    def __init__(self):
+        self.md5 = hashlib.md5()
+
+    def write(self, data):
+        self.md5.update(data)
+
+    def hexdigest(self):
+        return self.md5.hexdigest()
+
+## DiskCache
+#
+# Content-addressed on-disk cache: each entry is stored in its own file named after its key (a hash of everything the value depends on).
+# The least recently used entries are evicted when the total size of the cache exceeds maxsize.
+# An instance can be shared by several threads (eg: the threads prefetching the texts, see BaseTextReader.prefetch_texts()), and the cache directory by several processes.
+class DiskCache(object):
+
+    ## @var cachedir
+    # Directory where the entries are stored
+
+    ## @var maxsize
+    # Maximum total size of the cache in bytes (None for unlimited)
+
+    ## @var hits
+    # Number of entries found in the cache
+
+    ## @var misses
+    # Number of entries not found in the cache
+
+    # Extension of the entries files
+    ext = '.pkl'
+
+    ## Constructor
+    # @param cachedir Directory where to store the entries (will be created if it does not exist)
+    # @param maxsize Maximum total size of the cache in bytes (None or 0 for unlimited)
+    def __init__(self, cachedir, maxsize=None):
+        self.cachedir = cachedir
+        self.maxsize = maxsize or None
+        self.hits = 0
+        self.misses = 0
+        self.size = None # total size of the entries, computed at first need
+        self.lock = threading.Lock() # protects the counters, the total size and the eviction
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+    ## Compute a key from any picklable object (eg: a list of everything the cached value depends on)
+    # @param obj Any picklable object
+    # @return string Hex digest
+    @staticmethod
+    def hash(obj):
+        h = HashWriter()
+        pickle.Pickler(h, 2).dump(obj)
+        return h.hexdigest()
+
+    ## Path of the file of an entry
+    def path(self, key):
+        return os.path.join(self.cachedir, key[:2], key + self.ext)
+
+    ## Check if an entry exists in the cache
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    ## Get an entry from the cache
+    # @param key Key of the entry
+    # @param default Value to return if the entry is not in the cache
+    # @return The cached value, or default
+    def get(self, key, default=None):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            with self.lock:
+                self.misses += 1
+            return default
+        # Touch the file to mark it as recently used (for the LRU eviction)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return value
+
+    ## Store an entry in the cache
+    # @param key Key of the entry
+    # @param value Any picklable object
+    def set(self, key, value):
+        path = self.path(key)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: # maybe created concurrently by another process
+                pass
+        # Write in a temporary file and then rename it, so that a concurrent reader never sees a partial entry
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(path): # os.rename() cannot overwrite on Windows
+                try:
+                    os.remove(path)
+                except OSError: # already removed by another thread or process (eviction, or the same entry stored concurrently)
+                    pass
+            os.rename(tmppath, path)
+        except:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        with self.lock:
+            if self.size is not None:
+                try:
+                    self.size += os.path.getsize(path)
+                except OSError: # evicted meanwhile by another process
+                    pass
+            self._evict()
+
+    ## List all the entries of the cache
+    # Only the shards directories are scanned, so another cache can be stored in a subdirectory of this one
+    # @return list List of tuples (last access time, size, path)
+    def entries(self):
+        entries = list()
+        for shard in os.listdir(self.cachedir):
+            root = os.path.join(self.cachedir, shard)
+            if len(shard) != 2 or not os.path.isdir(root):
+                continue
+            for filename in os.listdir(root):
+                if filename.endswith(self.ext):
+                    path = os.path.join(root, filename)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    ## Evict the least recently used entries until the total size of the cache is below maxsize
+    def evict(self):
+        with self.lock:
+            self._evict()
+
+    ## Evict the least recently used entries (the lock must be held)
+    def _evict(self):
+        if not self.maxsize:
+            return
+        if self.size is not None and self.size <= self.maxsize:
+            return
+        entries = self.entries()
+        self.size = sum([size for (mtime, size, path) in entries])
+        if self.size <= self.maxsize:
+            return
+        # Remove the oldest entries first, down to 90% of maxsize so that we don't have to rescan the cache at every new entry
+        entries.sort()
+        for (mtime, size, path) in entries:
+            if self.size <= self.maxsize * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.size -= size
+            except OSError:
+                pass
+
+    ## Remove all the entries of the cache
+    def clear(self):
+        with self.lock:
+            for (mtime, size, path) in self.entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size = 0
@@ -108,6 +108,12 @@
 # def mymethod(X=None, Y=None, *args, **kwargs): # this will work and will be inheritable and overloadable
 #   pass
 #
+# - Runner only passes to your method the vars named in its arguments (here X and Y). If you really need to access any var, add a Vars argument: you will get the whole (read-only) namespace of vars.
+# Eg:
+#
+# def mymethod(X=None, Vars=None, *args, **kwargs):
+#   Y = Vars.get('Y')
+#
 # - If you want your returned values to be memorized in the Runner's global namespace (thus accessible to other modules) and saved in the parameters file, return your variables in a dictionary.
 # Eg:
 #
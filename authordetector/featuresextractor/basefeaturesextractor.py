@@ -24,6 +24,12 @@
 # IMPORTANT: the featuresextractors are responsible for fetching the texts from the readers modules. So you MUST use self.parent.reader.get_all_texts() somewhere in your code!
 
 from authordetector.base import BaseClass
+from authordetector.diskcache import DiskCache
+import itertools
+import weakref
+
+## Features extractors alive in this process, to rebuild the ChunkedFeatures sent back by the parallel workers (see ChunkedFeatures.__reduce__())
+_extractors = weakref.WeakSet()
 
 ## BaseFeaturesExtractor
 #
@@ -49,6 +55,9 @@ class BaseFeaturesExtractor(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'extract'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['X']
+
     constraints = {
         'after': None
     }
@@ -56,23 +65,144 @@ class BaseFeaturesExtractor(BaseClass):
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
+        _extractors.add(self)
         return BaseClass.__init__(self, config, parent, *args, **kwargs)
 
+    ## The features of chunked texts are lazy (see ChunkedFeatures), they can't be stored in the stages cache
+    @property
+    def cacheable(self):
+        return not self.parent.reader.get_chunksize()
+
+    ## Extract the features of one text (or one chunk of a text)
+    # The features extractors that implement this method get support for chunked texts for free by using extract_all()
+    # @param text Text (preprocessed)
+    # @param idx Index of the text (for information only)
+    # @return list List of features
+    def extract_text(self, text, idx=None, *args, **kwargs):
+        return text.split()
+
+    ## Extract the features of several texts with extract_text(), in order
+    # The features extractors can override this to extract several texts at once (see TreeTagger)
+    # @param texts Iterable of (index, text), read lazily
+    # @return gen A generator producing the features of each text, in the same order
+    def extract_texts(self, texts, *args, **kwargs):
+        for (idx, text) in texts:
+            yield self.extract_text(text, idx)
+
+    ## Extract the tokens streams of one text to store in the corpus store (see Runner.compile_corpus())
+    # The streams must hold everything needed to rebuild the features with any config of the extractor that is not part of get_stream_settings() (eg: TreeTagger stores both the lemmas and the grammatical categories)
+    # @param text Text (preprocessed)
+    # @param idx Index of the text (for information only)
+    # @return dict Dict of lists of tokens (strings), one per stream
+    def extract_streams(self, text, idx=None, *args, **kwargs):
+        return {'tokens': self.extract_text(text, idx)}
+
+    ## Rebuild the features of one text from its streams loaded from the corpus store (the reverse of extract_streams())
+    # @param streams Dict of lists of tokens, one per stream
+    # @param idx Index of the text (for information only)
+    # @return list List of features
+    def from_streams(self, streams, idx=None, *args, **kwargs):
+        return streams['tokens']
+
+    ## Return the config of this extractor the stored streams depend on
+    # @return list Config keys and values
+    def get_stream_settings(self, *args, **kwargs):
+        return self.get_config_values()
+
+    ## Compute the key of the streams of a text in the corpus store: the text (without reading it), the reader and preprocessors config, and this extractor and its config
+    # @param idx Index of the text in the reader
+    # @return string Hex digest
+    def get_store_key(self, idx, *args, **kwargs):
+        # The settings are hashed by their repr: the pickle of equal values may differ from one run to the next (pickle memoizes the strings shared by several values), and the store is kept across runs
+        return DiskCache.hash([self.parent.reader.get_stat_key(idx), self.__class__.__module__, self.__class__.__name__, repr(self.get_stream_settings())])
+
+    ## Load the features of a text from the corpus store, if the text was compiled in it (with the same preprocessors and extractor config)
+    # @param idx Index of the text in the reader
+    # @return list List of features, or None if the text is not in the store (or there is no store)
+    def load_features(self, idx, *args, **kwargs):
+        store = self.parent.__dict__.get('corpusstore', None)
+        if store is None:
+            return None
+        try:
+            streams = store.get(self.get_store_key(idx))
+        except OSError: # the text file is missing, let the reader complain
+            return None
+        if streams is None:
+            return None
+        return self.from_streams(streams, idx)
+
+    ## Extract the features of all the texts with extract_text()
+    # If reader_chunksize is set, the texts are not read here: the features of each text are a ChunkedFeatures object, which will read and extract the text chunk by chunk when the patterns extractor iterates over it
+    # If a corpus store is opened (see Runner.compile_corpus()), the features of the texts compiled in it are loaded from the store: these texts are not read, preprocessed nor extracted again
+    # @return list List of features per text
+    def extract_all(self, *args, **kwargs):
+        X = list()
+        reader = self.parent.reader
+        if reader.get_chunksize():
+            for idx in reader.get_indexes():
+                X.append(ChunkedFeatures(self, idx))
+        elif self.parent.__dict__.get('corpusstore', None) is not None:
+            missing = list()
+            for pos, idx in enumerate(reader.get_indexes()):
+                X.append(self.load_features(idx))
+                if X[pos] is None:
+                    missing.append((pos, idx))
+            if missing:
+                print("Corpus store: %s/%s texts are not compiled in the store (or changed), extracting them from the texts" % (len(missing), len(X)))
+            texts = ((pos, reader.get_text(idx)) for (pos, idx) in missing)
+            for ((pos, idx), features) in itertools.izip(missing, self.extract_texts(texts)):
+                X[pos] = features
+        else:
+            for features in self.extract_texts(enumerate(reader.get_all_texts())):
+                X.append(features)
+        return X
+
     ## Extract features from a text
-    # Here it simply splits each text into a list of unique words and then return them
+    # Here it simply splits each text into a list of words (see extract_text()), reading the texts in chunks if reader_chunksize is set and loading them from the corpus store if one is opened (see extract_all())
     # @param None The texts will be directly accessed through the Reader
-    # @return dict A dict containing X, a dict of features PER text (very important! eg: X[0] for the features of text 0, X[1] for the features of text 1, etc.)
+    # @return dict A dict containing X, the list of features PER text (very important! eg: X[0] for the features of text 0, X[1] for the features of text 1, etc.)
     def extract(self, *args, **kwargs):
-        #words = set()
-        words = dict()
+        return {'X': self.extract_all()}
+
+## ChunkedFeatures
+#
+# Lazy features of a text read in chunks (see BaseTextReader.get_text_chunks()): each iteration reads, preprocesses and extracts the features of the next chunk, so that the memory used is bounded by the size of the chunks and not by the size of the text.
+# The patterns extractors must accumulate the results of each chunk (see NGrams).
+class ChunkedFeatures(object):
+
+    ## Constructor
+    # @param extractor Features extractor (its extract_text() method is called on each chunk)
+    # @param idx Index of the text in the reader
+    def __init__(self, extractor, idx):
+        self.extractor = extractor
+        self.idx = idx
+
+    ## Iterate over the features of each chunk
+    # @return gen A generator producing one list of features per chunk
+    def __iter__(self):
+        for chunk in self.extractor.parent.reader.get_text_chunks(self.idx):
+            yield self.extractor.extract_text(chunk, self.idx)
 
-        gen = self.parent.reader.get_all_texts()
-        for idx, text in enumerate(gen):
-            # get all the words in a list, splitting on whitespaces
-            #words.update(set(text.split()))
-            words.update({idx: set(text.split())})
-            #words.append(text.split())
+    ## Return a fingerprint of the extractor and its texts: the texts, the features extractor and its config (it does not depend on the text index)
+    # @return string Hex digest
+    def get_fingerprint(self):
+        return DiskCache.hash([self.extractor.parent.reader.fingerprint(), self.extractor.__class__.__name__, self.extractor.get_config_values()])
 
-        del text
+    ## Only a description of the features is pickled (the fingerprint and the text index), both to compute the keys of the stages cache and to send the features back from the parallel workers: the parent process rebuilds them with its own features extractor, which is the same as in the forked worker
+    def __reduce__(self):
+        return (_rebuild_chunked, (self.extractor.__class__.__module__, self.extractor.__class__.__name__, self.get_fingerprint(), self.idx))
 
-        return {'X': words}
+## Rebuild a ChunkedFeatures object from its pickled description, with the features extractor of this process that has the same class, texts and config
+# @param module Module of the class of the features extractor
+# @param classname Name of the class of the features extractor
+# @param fingerprint Fingerprint of the extractor and its texts (see ChunkedFeatures.get_fingerprint())
+# @param idx Index of the text in the reader
+# @return ChunkedFeatures
+def _rebuild_chunked(module, classname, fingerprint, idx):
+    for extractor in list(_extractors):
+        if extractor.__class__.__module__ != module or extractor.__class__.__name__ != classname or extractor.__dict__.get('parent', None) is None:
+            continue
+        features = ChunkedFeatures(extractor, idx)
+        if features.get_fingerprint() == fingerprint:
+            return features
+    raise RuntimeError("Chunked features can't be unpickled: no features extractor %s with the same texts and config in this process, they must be extracted again from the texts" % classname)
@@ -22,9 +22,128 @@
 #
 # Use TreeTagger to parse all texts and returns lemmas or grammatical category
 
+from authordetector.base import stat_file
 from authordetector.featuresextractor.basefeaturesextractor import BaseFeaturesExtractor
+from authordetector.reader.basetextreader import BaseTextReader
+from authordetector.diskcache import DiskCache
 import authordetector.lib.treetagger.treetaggerwrapper as treetaggerwrapper
 import os
+import threading
+import itertools
+import collections
+import hashlib
+from array import array
+import Queue
+from multiprocessing.pool import ThreadPool
+
+## PersistentTagger
+#
+# A TreeTagger wrapper kept for all the extractions of a process (see TaggerPool): the wrapper (and its abbreviations lists) is built at the first call, the TreeTagger process is started at the first text and then kept alive for all the next texts, and it is started again if it died.
+class PersistentTagger(object):
+
+    ## Constructor (nothing is loaded nor started here)
+    # @param lang Language of TreeTagger
+    # @param tagdir Directory of TreeTagger
+    # @param charset Charset of the input and output of TreeTagger
+    # @param parfile Parameter file (None for the default one of the language)
+    def __init__(self, lang, tagdir, charset, parfile=None):
+        self.lang = lang
+        self.tagdir = tagdir
+        self.charset = charset
+        self.parfile = parfile
+        self.wrapper = None
+        self.lock = threading.Lock() # a TreeTagger process can only tag one text at a time
+        self.restarts = 0 # number of times the process had to be started again
+
+    ## Build the TreeTagger wrapper at the first call
+    def get_wrapper(self):
+        if self.wrapper is None:
+            self.wrapper = treetaggerwrapper.TreeTagger(TAGLANG=self.lang, TAGDIR=self.tagdir, TAGINENC=self.charset, TAGOUTENC=self.charset, TAGPARFILE=self.parfile)
+        return self.wrapper
+
+    ## Check if the TreeTagger process was started and died since
+    def is_dead(self):
+        return self.wrapper is not None and self.wrapper.tagpopen is not None and self.wrapper.tagpopen.poll() is not None
+
+    ## Drop a dead TreeTagger process, the wrapper will start a new one at the next text
+    def restart(self):
+        wrapper = self.wrapper
+        print("TreeTagger process died (exit code %s), starting it again..." % wrapper.tagpopen.returncode)
+        for pipe in (wrapper.taginput, wrapper.tagoutput):
+            try:
+                pipe.close()
+            except (IOError, OSError):
+                pass
+        wrapper.tagpopen = wrapper.taginput = wrapper.tagoutput = None
+        self.restarts += 1
+
+    ## Tag a text (same arguments as treetaggerwrapper.TreeTagger.TagText())
+    # If the process died during the tagging, the text is tagged again once with a new process.
+    # @return list List of the lines returned by TreeTagger
+    def TagText(self, text, *args, **kwargs):
+        with self.lock:
+            wrapper = self.get_wrapper()
+            if self.is_dead():
+                self.restart()
+            try:
+                return wrapper.TagText(text, *args, **kwargs)
+            except treetaggerwrapper.TreeTaggerError:
+                if not self.is_dead():
+                    raise
+                self.restart()
+                return wrapper.TagText(text, *args, **kwargs)
+
+## TaggerPool
+#
+# A pool of PersistentTagger of the same config, to tag several texts at once: TreeTagger is single-threaded, so each process tags one text at a time and the texts are dispatched to the free processes.
+# The processes are only started when needed (see resize()), and they are kept alive like the PersistentTagger.
+class TaggerPool(object):
+
+    ## Constructor (nothing is loaded nor started here)
+    # @param lang Language of TreeTagger
+    # @param tagdir Directory of TreeTagger
+    # @param charset Charset of the input and output of TreeTagger
+    # @param parfile Parameter file (None for the default one of the language)
+    def __init__(self, lang, tagdir, charset, parfile=None):
+        self.params = (lang, tagdir, charset, parfile)
+        self.taggers = list()
+        self.free = Queue.Queue() # taggers not tagging a text currently
+        self.lock = threading.Lock()
+
+    ## Make sure the pool has at least a given number of taggers (the pool never shrinks, the idle processes are kept for the next calls)
+    # @param size Number of taggers
+    def resize(self, size):
+        with self.lock:
+            while len(self.taggers) < size:
+                tagger = PersistentTagger(*self.params)
+                self.taggers.append(tagger)
+                self.free.put(tagger)
+
+    ## Build the TreeTagger wrapper of the first tagger (to check the config)
+    def get_wrapper(self):
+        self.resize(1)
+        return self.taggers[0].get_wrapper()
+
+    ## Number of times the processes of the pool had to be started again
+    @property
+    def restarts(self):
+        return sum(tagger.restarts for tagger in self.taggers)
+
+    ## Tag a text with the first free tagger of the pool (same arguments as treetaggerwrapper.TreeTagger.TagText())
+    # @return list List of the lines returned by TreeTagger
+    def TagText(self, text, *args, **kwargs):
+        self.resize(1)
+        tagger = self.free.get()
+        try:
+            return tagger.TagText(text, *args, **kwargs)
+        finally:
+            self.free.put(tagger)
+
+# TreeTaggers of this process, by (language, TreeTagger directory, charset, parameter file), shared by all the TreeTagger modules and runs (see TreeTagger.get_tagger())
+_taggers = dict()
+_taggerslock = threading.Lock()
+# Process in which _taggers was filled (a forked process must start its own TreeTaggers, the pipes of the parent's processes can't be shared)
+_taggerspid = None
 
 ## TreeTagger
 #
@@ -37,68 +156,276 @@ class TreeTagger(BaseFeaturesExtractor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    # (treetagger_workers is not one of them: the number of processes does not change the features)
+    configkeys = ["treetagger_lang", "treetagger_tmpdir", "treetagger_charset", "treetagger_parfile", "treetagger_split_size", "treetagger_return", "reader_charset"]
+
+    runtimekeys = ["treetagger_workers", "debug"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
         return BaseFeaturesExtractor.__init__(self, config, parent, *args, **kwargs)
 
+    ## Return the TreeTaggers of this config, shared by all the TreeTagger modules of the process: they are built at the first call, their processes are started at the first text and then kept alive between calls and runs (see PersistentTagger)
+    # A forked process (parallel workers) launches its own TreeTaggers, since the pipes of the parent's processes can't be shared.
+    # @return TaggerPool object (with the same TagText() method as the TreeTagger wrapper)
+    @staticmethod
+    def get_tagger_pool(lang, tagdir, charset, parfile=None):
+        global _taggerspid
+        key = (lang, os.path.abspath(tagdir), charset, parfile)
+        with _taggerslock:
+            if _taggerspid != os.getpid():
+                if _taggerspid is None:
+                    # Rename TreeTagger's Linux binary to avoid conflicts (by default, same name is used for both MacOSX and Linux binaries)
+                    for l in treetaggerwrapper.g_langsupport.iterkeys(): # update for each language
+                        treetaggerwrapper.g_langsupport[l]["binfile-lin"] = "tree-tagger-lin"
+                _taggers.clear() # forked process: forget the parent's TreeTaggers without closing their pipes (the parent still uses them)
+                _taggerspid = os.getpid()
+            if key not in _taggers:
+                _taggers[key] = TaggerPool(lang, tagdir, charset, parfile)
+            return _taggers[key]
+
+    ## Return the TreeTaggers for the config of this module
+    # @return TaggerPool object
+    def get_tagger(self, *args, **kwargs):
+        tagger = self.get_tagger_pool(self.config.get("treetagger_lang", "fr"), self.config.get("treetagger_tmpdir", os.path.join('authordetector', 'lib', 'treetagger', 'TreeTagger')), self.config.get("treetagger_charset", "utf-8"), self.config.get("treetagger_parfile", None))
+        tagger.get_wrapper() # load the wrapper now, to report a bad config before reading the texts
+        return tagger
+
+    ## Return the files TreeTagger reads (binary, parameter file and abbreviations file), so that the caches and the corpus store are invalidated when they are replaced (see BaseClass.get_config_files())
+    # @return list List of paths (empty if TreeTagger can't be found, the error is reported when tagging)
+    def get_config_files(self, *args, **kwargs):
+        try:
+            wrapper = self.get_tagger().get_wrapper()
+        except (treetaggerwrapper.TreeTaggerError, IOError, OSError):
+            return []
+        return [wrapper.tagbin, wrapper.tagparfile, wrapper.abbrevfile]
+
     ## Extract features from a text
     # This will extract and return either a list of lemmas, or either the grammatical categories
     # Thank's to Fabien Poulard for his tutorial (french): http://www.fabienpoulard.info/post/2011/01/09/Python-et-Tree-Tagger
     # @param None The texts will be directly accessed through the Reader
     # @return dict A dict containing X, a dict of features PER text (so X[0] will contain all the lemmas/gramcat for text 0, X[1] all features for text 1, etc.)
     def extract(self, *args, **kwargs):
+        # Launch TreeTagger now (and not at the first text), unless the texts may be loaded from the corpus store
+        if self.parent.__dict__.get('corpusstore', None) is None:
+            self.get_tagger()
 
-        # Rename TreeTagger's Linux binary to avoid conflicts (by default, same name is used for both MacOSX and Linux binaries)
-        for lang in treetaggerwrapper.g_langsupport.iterkeys(): # update for each language
-            treetaggerwrapper.g_langsupport[lang]["binfile-lin"] = "tree-tagger-lin"
+        # Get the features of all the available texts (or of their chunks if the texts are read in chunks)
+        # Check the files of TreeTagger only once for all the texts of this call
+        self.tagfingerprint = None
+        cache = self.get_tagcache()
+        if cache is not None:
+            (hits, misses) = (cache.hits, cache.misses)
+        tags = self.extract_all()
+        if cache is not None:
+            print("TreeTagger cache: %s hits, %s misses" % (cache.hits - hits, cache.misses - misses))
 
-        # Construction et configuration du wrapper
-        tagger = treetaggerwrapper.TreeTagger(TAGLANG=self.config.get("treetagger_lang", "fr"), TAGDIR=self.config.get("treetagger_tmpdir", os.path.join('authordetector', 'lib', 'treetagger', 'TreeTagger')),
-                                              TAGINENC=self.config.get("treetagger_charset", "utf-8"), TAGOUTENC=self.config.get("treetagger_charset", "utf-8"))
+        return {'X': tags} # always return a dict of vars
 
-        return_value = self.config.get("treetagger_return", '') # The type of features we want to return: lemmas, grammatical categories or both?
+    ## Return the number of TreeTagger processes to tag the texts with
+    def get_workers(self, *args, **kwargs):
+        return max(int(self.config.get("treetagger_workers", 1) or 1), 1)
+
+    ## Split a big text at the ends of sentences into pieces of about treetagger_split_size, which can be tagged separately (and concurrently)
+    # @param text Text (preprocessed)
+    # @return list List of pieces of the text (only the text itself if it's small enough)
+    def split_text(self, text, *args, **kwargs):
+        splitsize = int(float(self.config.get("treetagger_split_size", 1024) or 0) * 1024)
+        if not splitsize or len(text) <= splitsize:
+            return [text]
+        return [text[start:end] for (start, end) in BaseTextReader.split_chunks(text, splitsize)]
+
+    ## Return the tagger cache of the Runner, or None if it's disabled or if the texts are given in memory (they must be processed without touching the disk, see Runner.detect_texts())
+    # @return DiskCache object or None
+    def get_tagcache(self, *args, **kwargs):
+        if self.parent.reader.memtexts is not None:
+            return None
+        return self.parent.__dict__.get('tagcache', None)
+
+    ## Compute the fingerprint of everything that changes how TreeTagger tags a text (language, charsets, binary, parameter file and abbreviations file, with their sizes and modification times)
+    # It is computed only once per call of extract() (and kept for the other uses of the module, eg: Runner.compile_corpus()), not for every text
+    # @return list Parts of the fingerprint
+    def get_tagger_fingerprint(self, *args, **kwargs):
+        if self.__dict__.get('tagfingerprint', None) is None:
+            self.tagfingerprint = [self.config.get("treetagger_lang", "fr"), self.config.get("treetagger_charset", "utf-8"), self.config.get("reader_charset", 'utf-8'), [stat_file(path) for path in self.get_config_files()]]
+        return self.tagfingerprint
+
+    ## Compute the key of the output of TreeTagger for a text in the tagger cache: the content of the text and the fingerprint of TreeTagger
+    # @param text Text (preprocessed)
+    # @return string Hex digest
+    def get_cache_key(self, text, *args, **kwargs):
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        return DiskCache.hash([hashlib.md5(text).hexdigest(), self.get_tagger_fingerprint()])
+
+    ## Pack the triplets of a text to store them in the tagger cache: the grammatical categories and lemmas are replaced by ids in a vocabulary of the text (the original words are not needed for the features and are dropped)
+    # @param triplets List of triplets
+    # @return tuple (vocabulary list, string of the int32 ids of the grammatical category and the lemma of each word, interleaved)
+    @staticmethod
+    def pack_triplets(triplets):
+        vocab = dict()
+        ids = array('i')
+        for triplet in triplets:
+            for value in (triplet[1], triplet[2]):
+                if value not in vocab:
+                    vocab[value] = len(vocab)
+                ids.append(vocab[value])
+        words = [None] * len(vocab)
+        for (value, i) in vocab.iteritems():
+            words[i] = value
+        return (words, ids.tostring())
+
+    ## Unpack the triplets of a text loaded from the tagger cache (see pack_triplets())
+    # @param packed Tuple (vocabulary list, string of ids)
+    # @return list List of triplets, with an empty original word
+    @staticmethod
+    def unpack_triplets(packed):
+        (words, data) = packed
+        ids = array('i')
+        ids.fromstring(data)
+        return [['', words[ids[i]], words[ids[i+1]]] for i in xrange(0, len(ids), 2)]
+
+    ## Tag a piece of text with TreeTagger, or load its output from the tagger cache of the Runner (if enabled)
+    # @param text Text (preprocessed)
+    # @return list List of triplets (original word, grammatical category, lemma), one per word (the original word is empty for the triplets loaded from the cache)
+    def tag_piece(self, text, *args, **kwargs):
+        cache = self.get_tagcache()
+        if cache is not None:
+            key = self.get_cache_key(text)
+            packed = cache.get(key)
+            if packed is not None:
+                return self.unpack_triplets(packed)
+
+        tagger = self.get_tagger()
         charset = self.config.get("reader_charset", 'utf-8')
 
-        # Init the list
-        tags = list()
+        # Process through TreeTagger
+        triplets = tagger.TagText(text, encoding=charset) # TagText returns a list of items, each items being a triplet of: original word, grammatical category, lemma. Each one being separated by one \t
+
+        result = list()
+        for triplet in triplets:
+            # Encode our unicode object into UTF-8 (to make sure that all other Python modules will be able to correctly parse it, else modules will try to encode into ascii (instead of decoding) and you will get 'ascii' codec can't encode character...)
+            #triplet = triplet.encode('utf-8') # already done in basetextreader now
+            # Split the string into a triplet list
+            triplet = triplet.split("\t")
+            # If the triplet is still a string or the list contains only one item, it means TreeTagger couldn't parse it. We simply skip.
+            if isinstance(triplet, (str, basestring)) or len(triplet) == 1:
+                continue
+            result.append(triplet)
+
+        if cache is not None:
+            cache.set(key, self.pack_triplets(result))
+        return result
+
+    ## Tag a text with TreeTagger (piece by piece if it's big, see split_text())
+    # @param text Text (preprocessed)
+    # @return gen A generator producing one triplet (original word, grammatical category, lemma) per word
+    def tag(self, text, *args, **kwargs):
+        for piece in self.split_text(text):
+            for triplet in self.tag_piece(piece):
+                yield triplet
+
+    ## Tag several texts at once with a pool of treetagger_workers TreeTagger processes: the pieces of the texts (see split_text()) are dispatched to the free processes, and the features of each text are rebuilt from its pieces, in order
+    # @param texts Iterable of (index, text), read lazily
+    # @return gen A generator producing the features of each text, in the same order
+    def extract_texts(self, texts, *args, **kwargs):
+        workers = self.get_workers()
+        if workers <= 1:
+            for features in BaseFeaturesExtractor.extract_texts(self, texts):
+                yield features
+            return
 
-        # Get a generator to iterate over all the available texts
-        gen = self.parent.reader.get_all_texts()
-        for idx, text in enumerate(gen): # get text and index for each available file
-            # Init the sublist or subdict for the current text (one sublist or subdict of features per text)
+        self.get_tagger().resize(workers)
+        pool = ThreadPool(workers)
+        pending = collections.deque() # (idx, list of AsyncResult of its pieces) of the texts being tagged, in order
+        try:
+            for (idx, text) in texts:
+                pending.append((idx, [pool.apply_async(self.tag_piece, (piece,)) for piece in self.split_text(text)]))
+                del text
+                # Read the next texts only when there are less than two pieces waiting per process (to bound the memory), and return the oldest ones meanwhile
+                while sum(len(pieces) for (i, pieces) in pending) > 2 * workers:
+                    (i, pieces) = pending.popleft()
+                    yield self.make_features(itertools.chain.from_iterable(piece.get() for piece in pieces), i)
+            while pending:
+                (i, pieces) = pending.popleft()
+                yield self.make_features(itertools.chain.from_iterable(piece.get() for piece in pieces), i)
+        finally:
+            pool.terminate()
+
+    ## Filter out the unknown words from a list of lemmas
+    # @param tags List of lemmas
+    # @param idx Index of the text (for information only)
+    # @return list List of lemmas
+    def filter_lemmas(self, tags, idx=None, *args, **kwargs):
+        blen = len(tags)
+        tags = [x for x in tags if x != '<unknown>']
+        if self.config.get("debug"):
+            print("Removed %s unknown tags from lemmas of text %s" % ((blen-len(tags)), idx) )
+        return tags
+
+    ## Extract the lemmas and/or grammatical categories of one text
+    # @param text Text (preprocessed)
+    # @param idx Index of the text (for information only)
+    # @return list List of features (or dict of lists of lemmas and gramcat if treetagger_return is 'both')
+    def extract_text(self, text, idx=None, *args, **kwargs):
+        return self.make_features(self.tag(text), idx)
+
+    ## Build the features of one text from its triplets
+    # @param triplets Iterable of triplets (original word, grammatical category, lemma)
+    # @param idx Index of the text (for information only)
+    # @return list List of features (or dict of lists of lemmas and gramcat if treetagger_return is 'both')
+    def make_features(self, triplets, idx=None, *args, **kwargs):
+        return_value = self.config.get("treetagger_return", '') # The type of features we want to return: lemmas, grammatical categories or both?
+
+        # Init the sublist or subdict for the current text (one sublist or subdict of features per text)
+        if return_value == 'both':
+            tags = {'lemmas': list(), 'gramcat': list()}
+        else:
+            tags = list()
+
+        # Reformat the triplets and extract only what we want (save memory space and easier to access later)
+        for triplet in triplets:
+            # Store the values we want from the triplet (either lemmas, either grammatical categories, either both)
             if return_value == 'both':
-                tags.insert(idx, {'lemmas': list(), 'gramcat': list()} )
+                tags['lemmas'].append(triplet[2])
+                tags['gramcat'].append(triplet[1])
+            elif return_value == 'lemmas':
+                tags.append(triplet[2])
             else:
-                tags.insert(idx, list())
-
-            # Process through TreeTagger
-            triplets = tagger.TagText(text, encoding=charset) # TagText returns a list of items, each items being a triplet of: original word, grammatical category, lemma. Each one being separated by one \t
-
-            # Reformat the triplets and extract only what we want (save memory space and easier to access later)
-            for triplet in triplets:
-                # Encode our unicode object into UTF-8 (to make sure that all other Python modules will be able to correctly parse it, else modules will try to encode into ascii (instead of decoding) and you will get 'ascii' codec can't encode character...)
-                #triplet = triplet.encode('utf-8') # already done in basetextreader now
-                # Split the string into a triplet list
-                triplet = triplet.split("\t")
-                # If the triplet is still a string or the list contains only one item, it means TreeTagger couldn't parse it. We simply skip.
-                if isinstance(triplet, (str, basestring)) or len(triplet) == 1:
-                    continue
-
-                # Store the values we want from the triplet (either lemmas, either grammatical categories, either both)
-                if return_value == 'both':
-                    tags[idx]['lemmas'].append(triplet[2])
-                    tags[idx]['gramcat'].append(triplet[1])
-                elif return_value == 'lemmas':
-                    tags[idx].append(triplet[2])
-                else:
-                    tags[idx].append(triplet[1])
-
-            # For lemmas, we need to filter out unknown words
-            if return_value == 'lemmas':
-                blen = len(tags[idx])
-                tags[idx] = [x for x in tags[idx] if x != '<unknown>']
-                if self.config.get("debug"):
-                    print("Removed %s unknown tags from lemmas of text %s" % ((blen-len(tags[idx])), idx) )
+                tags.append(triplet[1])
 
-        return {'X': tags} # always return a dict of vars
+        # For lemmas, we need to filter out unknown words
+        if return_value == 'lemmas':
+            tags = self.filter_lemmas(tags, idx)
+
+        return tags
+
+    ## Extract both the lemmas and the grammatical categories of one text for the corpus store, so that the stored text can be used with any treetagger_return
+    # @param text Text (preprocessed)
+    # @param idx Index of the text (for information only)
+    # @return dict Dict of the lists of lemmas (unknown words not filtered) and gramcat
+    def extract_streams(self, text, idx=None, *args, **kwargs):
+        streams = {'lemmas': list(), 'gramcat': list()}
+        for triplet in self.tag(text):
+            streams['lemmas'].append(triplet[2])
+            streams['gramcat'].append(triplet[1])
+        return streams
+
+    ## Rebuild the features of one text from the lemmas and gramcat loaded from the corpus store, as extract_text() would return them
+    # @param streams Dict of the lists of lemmas and gramcat
+    # @param idx Index of the text (for information only)
+    # @return list List of features (or dict of lists of lemmas and gramcat if treetagger_return is 'both')
+    def from_streams(self, streams, idx=None, *args, **kwargs):
+        return_value = self.config.get("treetagger_return", '')
+        if return_value == 'both':
+            return {'lemmas': streams['lemmas'], 'gramcat': streams['gramcat']}
+        elif return_value == 'lemmas':
+            return self.filter_lemmas(streams['lemmas'], idx)
+        else:
+            return streams['gramcat']
+
+    ## The stored streams do not depend on treetagger_return (both lemmas and gramcat are stored)
+    def get_stream_settings(self, *args, **kwargs):
+        return [(key, value) for (key, value) in self.get_config_values() if key != 'treetagger_return']
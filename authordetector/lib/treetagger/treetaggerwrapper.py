@@ -1083,6 +1083,13 @@ class TreeTagger (object) :
             line = self.tagoutput.readline()
             if DEBUG : logger.debug("Read from TreeTagger: %r",line)
             if not line :
+                # The process died: no more output will ever come.
+                if self.tagpopen.poll() is not None :
+                    t.join()
+                    logger.error("TreeTagger process died (exit code %s).",
+                                 self.tagpopen.returncode)
+                    raise TreeTaggerError,"TreeTagger process died (exit "+\
+                                          "code %s)." % self.tagpopen.returncode
                 # We process too much quickly, leave time for tagger and writer
                 # thread to worl.
                 time.sleep(0.1)
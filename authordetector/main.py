@@ -59,6 +59,20 @@ def parse_cmdline_args(argv=None):
                         help='path to the config listing unlabeled texts to identify')
     parser.add_argument('--learn', '-l', dest='learn', action='store_true', default=False,
                         help='Learning mode: learn the parameters from the labeled texts (if not specified, detection mode will be enabled)')
+    parser.add_argument('--cache', dest='cache', action='store_true', default=False,
+                        help='Enable the stages cache (in cache_dir, see the config file): reload the output of every module from the cache when its inputs did not change instead of recomputing it')
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true', default=False,
+                        help='Disable the stages cache: always recompute the output of every module instead of reloading it from the cache when its inputs did not change')
+    parser.add_argument('--cache-dir', dest='cache_dir', action='store',
+                        help='path to the directory where the stages cache is stored (default: cache)')
+    parser.add_argument('--batch', '-b', dest='batch', action='store', nargs='+',
+                        help='Batch detection mode: identify the texts of several textconfig_detection files (paths or glob patterns) in one run, loading the parameters only once. The results of each file are saved next to it (eg: case1.json -> case1_results.txt)')
+    parser.add_argument('--incremental', dest='learn_incremental', action='store_true',
+                        help='Incremental learning: only learn the texts that are not in the parametersfile yet, and add them to the parameters learned previously (see learn_incremental in the config file)')
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                        help='Resume an interrupted learning at the first incomplete stage, using the checkpoint saved after each stage (see checkpoint in the config file)')
+    parser.add_argument('--compile_corpus', dest='compile_corpus', action='store_true', default=False,
+                        help='Compile the corpus store: extract the tokens of the texts to learn and to identify once and store them in corpus_store (see the config file), so that the next learning and detection runs do not read, preprocess and tag these texts again')
 
 
 
@@ -93,6 +107,13 @@ def main(argv=None):
         runner = Runner()
         runner.init(args, extras)
         return runner
+    # Corpus compilation mode
+    elif args['compile_corpus']:
+        print("AuthorDetector: Corpus compilation mode")
+        print("Initialization of the Runner module and all submodules specified in the config file %s..." % args['config'])
+        runner = Runner()
+        runner.init(args, extras)
+        return runner.compile_corpus()
     # Learning mode
     elif args['learn']:
         print("AuthorDetector: Learning mode")
@@ -101,6 +122,13 @@ def main(argv=None):
         runner.init(args, extras)
         print("Learning the parameters from texts defined in %s and saving in %s.\nPlease wait, this may take a while depending on how big your datafile is..." % (args['textconfig'], args['parametersfile']))
         return runner.learn()
+    # Batch detection mode
+    elif args.get('batch'):
+        print("AuthorDetector: Batch detection mode")
+        print("Initialization of the Runner module and all submodules specified in the config file %s..." % args['config'])
+        runner = Runner()
+        runner.init(args, extras)
+        return runner.run_batch(runner.config.get('batch'))
     # Run the detection mode by default
     else:
         print("AuthorDetector: Detection mode")
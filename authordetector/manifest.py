@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package manifest
+#
+# JSONL texts manifests: a textconfig with one text per line (eg: {"file": "authorA/text1.txt", "author": "authorA"}), which is indexed by line offsets and parsed lazily, one entry at a time, instead of loading the whole list in memory.
+# Empty lines and lines beginning with // or # are ignored.
+
+from authordetector.configparser import json
+from array import array
+import errno
+import hashlib
+import os
+import threading
+
+# Extensions of the manifests files
+extensions = ('.jsonl', '.ndjson')
+
+## Check if a textconfig file is a JSONL manifest (from its extension)
+def is_manifest(path):
+    return path is not None and path.lower().endswith(extensions)
+
+## ManifestEntries
+#
+# Read-only list of the entries of a manifest: only the offsets of the lines are kept in memory, and each entry is parsed when it is accessed
+class ManifestEntries(object):
+
+    # Maximum number of parsed entries kept in memory
+    cachesize = 4096
+
+    ## Constructor
+    # @param path Path of the manifest
+    def __init__(self, path):
+        self.path = path
+        self.offsets = None
+        self.cache = dict()
+        self.lock = threading.Lock() # the entries may be read by several prefetch threads
+        self.file = None
+        self.pid = None
+
+    ## Index the offsets of the lines of the manifest, at the first access
+    def index(self):
+        offsets = array('L')
+        pos = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                s = line.strip()
+                if s and not s.startswith('//') and not s.startswith('#'):
+                    offsets.append(pos)
+                pos += len(line)
+        self.offsets = offsets
+
+    def __len__(self):
+        if self.offsets is None:
+            self.index()
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        if self.offsets is None:
+            self.index()
+        if idx < 0:
+            idx += len(self.offsets)
+        entry = self.cache.get(idx)
+        if entry is None:
+            with self.lock:
+                # Reopen the file in a forked process, the file position can't be shared with the parent
+                if self.file is None or self.pid != os.getpid():
+                    self.file = open(self.path, 'rb')
+                    self.pid = os.getpid()
+                self.file.seek(self.offsets[idx])
+                line = self.file.readline()
+            entry = json.loads(line)
+            if len(self.cache) >= self.cachesize:
+                self.cache.clear()
+            self.cache[idx] = entry
+        return entry
+
+    def __iter__(self):
+        for idx in xrange(len(self)):
+            yield self[idx]
+
+    ## Return a fingerprint of the manifest without parsing its entries: its path, size and modification time, and the offsets of its lines
+    # @return tuple (path, size, mtime, md5 of the offsets)
+    def fingerprint(self):
+        if self.offsets is None:
+            self.index()
+        st = os.stat(self.path)
+        return (self.path, st.st_size, st.st_mtime, hashlib.md5(self.offsets.tostring()).hexdigest())
+
+## Manifest
+#
+# Same interface as the ConfigParser used by the readers to load a textconfig (init(), load(), get() and config), but for a JSONL manifest
+class Manifest(object):
+
+    # Path of the manifest
+    configfile = None
+
+    # Entries of the manifest (a list can also be assigned, eg: to remove some entries)
+    config = []
+
+    ## Set the path of the manifest
+    # @param configfile Path of the manifest
+    def init(self, configfile=None, *args, **kwargs):
+        if configfile:
+            if not os.path.isfile(configfile):
+                raise IOError(errno.ENOENT, "Can't open the specified manifest file", configfile)
+            self.configfile = configfile
+
+    ## Load the manifest (only its lines offsets are indexed, at the first access)
+    def load(self, *args, **kwargs):
+        self.config = ManifestEntries(self.configfile)
+
+    ## Return the entry of a text
+    # @param idx Index of the text
+    def get(self, idx, *args, **kwargs):
+        try:
+            return self.config[idx]
+        except IndexError:
+            if args:
+                return args[0]
+            return None
@@ -48,6 +48,9 @@ class BaseMerger(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'merge'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['Patterns']
+
     constraints = {
         'after': 'patternsextractor'
     }
@@ -66,3 +69,13 @@ class BaseMerger(BaseClass):
 
         # Return the resulting variables (in a dict of vars)
         return {'Patterns': Patterns}
+
+    ## Fold the Patterns table of one text into the merged Patterns tables, so that texts can be merged one at a time (streaming)
+    # Here it simply stores the table of the text as-is
+    # @param P2 The merged Patterns tables (will be updated in place)
+    # @param idx Index of the text in the reader
+    # @param patterns The Patterns table of this text
+    # @return dict P2 the merged Patterns tables
+    def fold(self, P2, idx, patterns, *args, **kwargs):
+        P2[idx] = patterns
+        return P2
@@ -38,6 +38,9 @@ class CountMerger(BaseMerger):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["merger_attribute"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -48,40 +51,50 @@ class CountMerger(BaseMerger):
     # @param Patterns The extracted patterns
     # @return dict A dict containing Patterns tables per attribute, and per attribute type (eg: Patterns['author']['Machiavel']), the patterns matched to the desired attribute(s)
     def merge(self, Patterns=None, *args, **kwargs):
+        # Init a dict of Patterns tables for this type of attributes (this is the var that will be returned)
+        P2 = dict()
+        # for each text
+        for idx in xrange(len(self.parent.reader)):
+            self.fold(P2, idx, Patterns[idx])
+
+        # Return the resulting variables (in a dict of vars)
+        return {'Patterns': P2}
+
+    ## Fold the Patterns table of one text into the Patterns tables per attribute, by adding the counts and then recomputing the frequencies
+    # This is what merge() does for each text, but it can also be called one text at a time (streaming)
+    # @param P2 The Patterns tables per attribute (will be updated in place)
+    # @param idx Index of the text in the reader
+    # @param patterns The Patterns table of this text
+    # @return dict P2 the Patterns tables per attribute
+    def fold(self, P2, idx, patterns, *args, **kwargs):
         mattr = self.config.get("merger_attribute", 'author') # Type of attribute to match the patterns to. This MUST be implemented in all subclasses
 
         # Convert to a list of attributes if it's a string
         #if isinstance(merger_attribute, basestring): # removed, too complex to interop with other modules
             #merger_attribute = [merger_attribute]
 
-        # Init a dict of Patterns tables for this type of attributes (this is the var that will be returned)
-        P2 = dict()
-        # for each text
-        for idx in xrange(len(self.parent.reader)):
-            # get all text attributes
-            allattr = self.parent.reader.get_params(idx)
-            # fetch the one of the type we want
-            attr = allattr[mattr]
-
-            # If the current Patterns table is empty, we just copy over the Patterns table of the text (we will complete it further later with tables of other texts matching the same attribute)
-            if P2.get(attr) is None:
-                P2[attr] = Patterns[idx]
-            # Else we already have a Patterns table from a previous text, then we complete it with the data from the Patterns table of this text
-            else:
-                # for each index and row of this Patterns table
-                for idn2, s in Patterns[idx].iterrows():
-                    # If there is a collision (the pattern already exists in the current table), then we add both counts
-                    if idn2 in P2[attr].index:
-                        P2[attr].ix[idn2, 'count'] += s['count']
-                    #else: # Else no collision, the n-gram is new, we append it to the Patterns table - UNEFFICIENT!!!
-                        #P2[attr] = P2[attr].append(s, ignore_index=False) # UNEFFICIENT!!! Infinite time! Workaround below
-
-                # Append in one go all the new patterns where there's no collision (the patterns exist in the table2, but not in table1)
-                P2[attr] = P2[attr].append(Patterns[idx].ix[~Patterns[idx].index.isin(P2[attr].index)]) # TODO: verifier pas trompe de sens dans le isin() ici
-
-                # Recompute the frequencies in one go + order by frequencies
-                P2[attr] = TermFrequency.tf(P2[attr])
+        # get all text attributes
+        allattr = self.parent.reader.get_params(idx)
+        # fetch the one of the type we want
+        attr = allattr[mattr]
 
+        # If the current Patterns table is empty, we just copy over the Patterns table of the text (we will complete it further later with tables of other texts matching the same attribute)
+        if P2.get(attr) is None:
+            P2[attr] = patterns
+        # Else we already have a Patterns table from a previous text, then we complete it with the data from the Patterns table of this text
+        else:
+            # for each index and row of this Patterns table
+            for idn2, s in patterns.iterrows():
+                # If there is a collision (the pattern already exists in the current table), then we add both counts
+                if idn2 in P2[attr].index:
+                    P2[attr].ix[idn2, 'count'] += s['count']
+                #else: # Else no collision, the n-gram is new, we append it to the Patterns table - UNEFFICIENT!!!
+                    #P2[attr] = P2[attr].append(s, ignore_index=False) # UNEFFICIENT!!! Infinite time! Workaround below
 
-        # Return the resulting variables (in a dict of vars)
-        return {'Patterns': P2}
+            # Append in one go all the new patterns where there's no collision (the patterns exist in the table2, but not in table1)
+            P2[attr] = P2[attr].append(patterns.ix[~patterns.index.isin(P2[attr].index)]) # TODO: verifier pas trompe de sens dans le isin() ici
+
+            # Recompute the frequencies in one go + order by frequencies
+            P2[attr] = TermFrequency.tf(P2[attr])
+
+        return P2
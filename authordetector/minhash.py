@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package minhash
+#
+# MinHash signatures of texts and Locality Sensitive Hashing (LSH), to find the near-duplicate texts of a corpus without comparing all the pairs of texts.
+# The similarity of two texts is the Jaccard index of their sets of shingles (sequences of k consecutive words), which is estimated by the proportion of equal values in their MinHash signatures.
+
+import re
+import zlib
+import numpy as np
+
+# Words of a text
+wordpat = re.compile(r'\w+', re.U)
+
+# Prime modulus of the hash functions: the smallest prime above 2^32 (the hashes of the shingles are 32 bits and a < 2^31, so a*x+b fits in 64 bits)
+prime = np.uint64(4294967311)
+
+## MinHash
+#
+# Compute the MinHash signatures of texts, with a fixed family of hash functions h(x) = (a*x + b) mod prime (so that the signatures of different runs can be compared)
+class MinHash(object):
+
+    ## Constructor
+    # @param permutations Number of hash functions (length of the signatures)
+    # @param shingles Number of words per shingle
+    # @param seed Seed of the random hash functions
+    def __init__(self, permutations=128, shingles=5, seed=1):
+        rand = np.random.RandomState(seed)
+        self.a = rand.randint(1, 1 << 31, size=permutations).astype(np.uint64)
+        self.b = rand.randint(0, 1 << 31, size=permutations).astype(np.uint64)
+        self.permutations = permutations
+        self.shingles = shingles
+
+    ## Compute the hashes of the shingles of a text
+    # @param text Text (unicode)
+    # @return ndarray Unique 32 bits hashes of the shingles
+    def hash_shingles(self, text):
+        words = wordpat.findall(text.lower())
+        k = min(self.shingles, len(words)) or 1
+        hashes = set()
+        for i in xrange(max(len(words) - k + 1, 1)):
+            hashes.add(zlib.crc32(u' '.join(words[i:i+k]).encode('utf-8')) & 0xffffffff)
+        return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+    ## Compute the MinHash signature of a text
+    # The shingles are hashed by batches, to bound the memory used by big texts
+    # @param text Text (unicode)
+    # @param batch Number of shingles hashed at once
+    # @return ndarray Signature (one minimum per hash function)
+    def signature(self, text, batch=4096):
+        x = self.hash_shingles(text)
+        sig = np.empty(self.permutations, dtype=np.uint64)
+        sig.fill(np.iinfo(np.uint64).max)
+        for i in xrange(0, len(x), batch):
+            h = (self.a[:, np.newaxis] * x[np.newaxis, i:i+batch] + self.b[:, np.newaxis]) % prime
+            np.minimum(sig, h.min(axis=1), out=sig)
+        return sig
+
+## Estimate the Jaccard similarity of two texts from their signatures
+def similarity(sig1, sig2):
+    return float(np.mean(sig1 == sig2))
+
+## Choose the number of rows per band of the LSH, so that the pairs with a similarity around the threshold are very likely to be candidates
+# With b bands of r rows, a pair of similarity s is a candidate with probability 1-(1-s^r)^b, which rises sharply around (1/b)^(1/r)
+# @param permutations Length of the signatures
+# @param threshold Jaccard similarity threshold
+# @return int Number of rows per band
+def get_rows(permutations, threshold):
+    rows = 1
+    for r in xrange(1, permutations + 1):
+        if permutations % r == 0 and (1.0 / (permutations // r)) ** (1.0 / r) <= threshold * 0.8:
+            rows = r
+    return rows
+
+## Find the pairs of near-duplicate texts with LSH: only the pairs which share at least one band of their signatures are compared
+# @param signatures List of signatures (one per text)
+# @param threshold Minimum Jaccard similarity
+# @return list List of (index1, index2, similarity) with index1 < index2, sorted by index
+def near_duplicates(signatures, threshold):
+    if not signatures:
+        return []
+    permutations = len(signatures[0])
+    rows = get_rows(permutations, threshold)
+    candidates = set()
+    for start in xrange(0, permutations, rows):
+        buckets = dict()
+        for idx, sig in enumerate(signatures):
+            buckets.setdefault(sig[start:start+rows].tostring(), []).append(idx)
+        for bucket in buckets.itervalues():
+            for i in xrange(len(bucket)):
+                for j in xrange(i + 1, len(bucket)):
+                    candidates.add((bucket[i], bucket[j]))
+    pairs = list()
+    for (i, j) in sorted(candidates):
+        s = similarity(signatures[i], signatures[j])
+        if s >= threshold:
+            pairs.append((i, j, s))
+    return pairs
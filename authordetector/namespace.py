@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package namespace
+#
+# Layered copy-on-write namespace of vars, to pass vars to modules without copying the whole dict of vars at each call
+
+import inspect
+
+## Namespace
+#
+# A layered namespace of vars: lookups go through the local layer first and then through the parent (another Namespace or a plain dict such as Runner.vars), and writes only go into the local layer, so the parent is never modified nor copied.
+# It can be used like a read-only dict by modules (get(), [], in, keys(), iteritems()).
+class Namespace(object):
+
+    ## @var parent
+    # Parent namespace (a Namespace or a dict), or None
+
+    ## @var layer
+    # Dict of the vars set in this layer
+
+    # Marker of a var deleted in this layer (but which may still exist in the parent)
+    _deleted = object()
+
+    ## Constructor
+    # @param parent Parent namespace (a Namespace or a dict), which will be read but never modified
+    # @param layer Dict of vars to put in the local layer (copied, so the caller's dict is never modified)
+    def __init__(self, parent=None, layer=None):
+        self.parent = parent
+        self.layer = dict(layer) if layer else dict()
+
+    ## Create a new layer on top of this one
+    # @param layer Dict of vars to put in the new layer
+    def child(self, layer=None):
+        return Namespace(self, layer)
+
+    def __getitem__(self, key):
+        value = self.layer.get(key, self)
+        if value is Namespace._deleted:
+            raise KeyError(key)
+        elif value is not self:
+            return value
+        elif self.parent is not None:
+            return self.parent[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        value = self.layer.get(key, self)
+        if value is not self:
+            return value is not Namespace._deleted
+        return self.parent is not None and key in self.parent
+
+    def __setitem__(self, key, value):
+        self.layer[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.layer[key] = Namespace._deleted
+
+    ## Set several vars in the local layer
+    # @param dictofvars Dict of vars
+    def update(self, dictofvars):
+        self.layer.update(dictofvars)
+
+    def keys(self):
+        keys = set(self.parent.keys()) if self.parent is not None else set()
+        for (key, value) in self.layer.iteritems():
+            if value is Namespace._deleted:
+                keys.discard(key)
+            else:
+                keys.add(key)
+        return list(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def iteritems(self):
+        for key in self.keys():
+            yield (key, self[key])
+
+    def items(self):
+        return list(self.iteritems())
+
+    ## Return the vars set in the local layer (ie: what changed compared to the parent)
+    # @return dict
+    def changed(self):
+        return dict((key, value) for (key, value) in self.layer.iteritems() if value is not Namespace._deleted)
+
+    ## Return all the vars of all the layers in a plain dict (this copies the namespace, use only when really needed)
+    # @return dict
+    def flatten(self):
+        return dict(self.iteritems())
+
+## Cache of the names of the arguments of methods, by class and method name
+_argnames = dict()
+
+## Return the arguments of a method (cached)
+# @param obj Object (module)
+# @param method Name of the method (as string)
+# @return tuple (list of the names of the arguments without self and Vars, True if the method has a Vars argument, True if the method accepts **kwargs)
+def _get_argspec(obj, method):
+    key = (obj.__class__, method)
+    if key not in _argnames:
+        argspec = inspect.getargspec(getattr(obj, method))
+        argnames = argspec.args[1:] # skip self
+        _argnames[key] = ([name for name in argnames if name != 'Vars'], 'Vars' in argnames, argspec.keywords is not None)
+    return _argnames[key]
+
+## Return the names of the arguments of a method (without self), so that only the vars a module asks for are passed to it
+# @param obj Object (module)
+# @param method Name of the method (as string)
+# @return tuple (list of the names of the arguments, True if the method can read the whole namespace: it accepts a Vars argument or **kwargs)
+def get_argnames(obj, method):
+    (argnames, wantvars, wantkwargs) = _get_argspec(obj, method)
+    return (argnames, wantvars or wantkwargs)
+
+## Build the keyword arguments to call the method of a module: only the vars named in its arguments are fetched from the namespace, except if the method accepts **kwargs (eg: def extract(self, *args, **kwargs) reading kwargs['X']), then all the vars are passed
+# @param obj Object (module)
+# @param method Name of the method (as string)
+# @param allvars Namespace or dict of vars
+# @return dict Keyword arguments
+def get_kwargs(obj, method, allvars):
+    (argnames, wantvars, wantkwargs) = _get_argspec(obj, method)
+    if wantkwargs:
+        kwargs = dict(allvars.iteritems()) # only the references are copied, not the vars
+    else:
+        kwargs = dict()
+        for name in argnames:
+            if name in allvars:
+                kwargs[name] = allvars[name]
+    if wantvars:
+        kwargs['Vars'] = allvars
+    return kwargs
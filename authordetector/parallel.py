@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package parallel
+#
+# Run functions in parallel in forked worker processes.
+# The workers are forked, so they inherit the whole memory of the parent (modules, config and vars) for free by copy-on-write: only the returned values are pickled and sent back to the parent.
+
+import os, sys
+import traceback
+import multiprocessing
+import Queue
+
+## Check if we can fork workers that inherit the memory of the parent process (not possible on Windows)
+def can_fork():
+    return hasattr(os, 'fork') and sys.platform != 'win32'
+
+## Return the number of workers to use
+# @param workers Number of workers wanted (None or 0 to use all the cores available)
+def get_workers(workers=None):
+    try:
+        workers = int(workers or 0)
+    except (TypeError, ValueError):
+        workers = 0
+    if workers <= 0:
+        try:
+            workers = multiprocessing.cpu_count()
+        except NotImplementedError:
+            workers = 1
+    return workers
+
+## Worker entry point (in the forked child process): call func on the item and send back the result (or the traceback) to the parent
+def _worker(func, idx, item, queue):
+    try:
+        result = func(item)
+        queue.put((idx, True, result))
+    except BaseException:
+        queue.put((idx, False, traceback.format_exc()))
+    sys.stdout.flush()
+
+## Apply func on every item in parallel, using a bounded number of forked processes
+# If forking is not possible (Windows) or only one worker is asked, the items are processed serially in the current process
+# @param func Function to call for each item (it does not need to be picklable, but its return value does)
+# @param items List of items
+# @param workers Maximum number of processes running concurrently (None or 0 to use all the cores available)
+# @return list List of the results, in the same order as items
+def fork_map(func, items, workers=None):
+    return fork_dag(func, items, workers=workers)
+
+## Apply func on every item in parallel, respecting dependencies between items: an item is started only when all the items it depends on are done
+# Each item is processed in a process forked at the moment the item is started, so it inherits everything that callback() did in the parent with the results of the items it depends on.
+# When only one item can be started and no other is running, it is processed directly in the current process (nothing to parallelize, and this avoids sending back its result through a pipe).
+# @param func Function to call for each item (it does not need to be picklable, but its return value does)
+# @param items List of items
+# @param deps Dict of dependencies: deps[i] is the set of indexes of the items that must be done before item i is started
+# @param workers Maximum number of processes running concurrently (None or 0 to use all the cores available)
+# @param callback Function callback(idx, result) called in the current process as soon as an item is done
+# @param done Indexes of the items that are already done (they will be skipped, and their result will be None)
+# @return list List of the results, in the same order as items
+def fork_dag(func, items, deps=None, workers=None, callback=None, done=None):
+    items = list(items)
+    if deps is None:
+        deps = dict()
+    workers = get_workers(workers)
+    serial = workers <= 1 or not can_fork()
+
+    results = [None] * len(items)
+    done = set(done) if done else set()
+    remaining = dict((idx, set(deps.get(idx, []))) for idx in xrange(len(items)) if idx not in done) # items not done yet, with their dependencies
+    running = dict() # idx -> Process
+    queue = None
+
+    ## Store the result of an item and notify the caller
+    def finish(idx, result):
+        results[idx] = result
+        done.add(idx)
+        del remaining[idx]
+        if callback is not None:
+            callback(idx, result)
+
+    try:
+        while remaining:
+            ready = [idx for idx in sorted(remaining.iterkeys()) if idx not in running and remaining[idx] <= done]
+            if not ready and not running:
+                raise RuntimeError('Cyclic dependencies between the items %s' % sorted(remaining.iterkeys()))
+            # Process directly in the current process if we can't fork or if there is nothing else to do in parallel
+            if ready and (serial or (len(ready) == 1 and not running)):
+                finish(ready[0], func(items[ready[0]]))
+                continue
+            # Launch new workers while there are free slots
+            if queue is None:
+                queue = multiprocessing.Queue()
+            for idx in ready:
+                if len(running) >= workers:
+                    break
+                sys.stdout.flush() # flush before forking, else the buffered output will be printed twice
+                p = multiprocessing.Process(target=_worker, args=(func, idx, items[idx], queue))
+                p.start()
+                running[idx] = p
+            # Wait for one result
+            try:
+                idx, success, result = queue.get(timeout=1)
+            except Queue.Empty:
+                # Check that no worker died without sending back its result (eg: killed or segfault)
+                for idx, p in running.items():
+                    if p.exitcode is not None and p.exitcode != 0:
+                        raise RuntimeError('Parallel worker %s died unexpectedly with exit code %s' % (idx, p.exitcode))
+                continue
+            if not success:
+                raise RuntimeError('Exception in parallel worker %s:\n%s' % (idx, result))
+            running.pop(idx).join()
+            finish(idx, result)
+    finally:
+        # Cleanup any remaining worker (only in case of error)
+        for p in running.itervalues():
+            if p.is_alive():
+                p.terminate()
+    return results
@@ -48,6 +48,9 @@ class BasePatternsExtractor(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'extract'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['Patterns']
+
     constraints = {
         'after': 'featuresextractor'
     }
@@ -59,7 +62,9 @@ class BasePatternsExtractor(BaseClass):
 
     ## Extract patterns from a text
     # Here it simply returns the input
-    # @param X The extracted features
-    # @return dict A dict containing Patterns, the patterns
+    # @param X The extracted features (a list or a dict of features per text)
+    # @return dict A dict containing Patterns, the patterns (a dict of features per text)
     def extract(self, X=None, *args, **kwargs):
-        return {'Patterns': dict(X)}
+        if isinstance(X, dict):
+            return {'Patterns': dict(X)}
+        return {'Patterns': dict(enumerate(X))}
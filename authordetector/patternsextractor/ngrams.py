@@ -23,6 +23,7 @@
 # This contains the words ngrams patterns extractor
 
 from authordetector.patternsextractor.basepatternsextractor import BasePatternsExtractor
+from authordetector.featuresextractor.basefeaturesextractor import ChunkedFeatures
 import pandas as pd
 import hashlib
 import numbers
@@ -40,6 +41,9 @@ class NGrams(BasePatternsExtractor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["ngrams_number", "ngrams_sort", "ngrams_wildcards", "ngrams_wildcards_mode_learning", "ngrams_wildcards_mode_detection", "ngrams_wildcards_placeholder"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -105,64 +109,71 @@ class NGrams(BasePatternsExtractor):
             patterns.update({idx: dict()}) # init the dict of ngrams for this text
             #patterns.insert(idx, zip(*[Text[i:-n+i] for i in xrange(n)]) ) # one-liner to generate n-grams but without frequencies. It is sort of computationally vectorised, meaning that it first produces n copies of the original list, but shifted (first list is not shifted, second list is by 1, third by 2, etc.), and then one item per list is coupled with the others (thus you end up with a list of couples of n words).
 
-            # For each n-gram
-            # Note: we place a moving start cursor (placed on the first word of each ngram)
-            for i in xrange(len(Text)-n):
-
-                # -- Prepare the ngram(s)
-
-                # Get the ngram (a simple list slice from cursor i to i+n)
-                ngram = Text[i:i+n]
-
-                # Sort alphabetically the ngrams if we chose to (thus we lower the number of ngrams by removing permutations, eg: [c, a, b] will be the same as [a, b, c])
-                if tosort: ngram = sorted(ngram, key=str.lower)
-
-                # If dynamic wildcards enabled, duplicate the ngram and generate all combinations with wildcards in different positions
-                if dynamic_wildcards:
-                    #ngrams = [ngram[:] for x in xrange(len(wmasks))]
-                    ngrams = []
-                    for w in wmasks:
-                        # Replace mode
-                        if wildcards_mode == 'replace':
-                            g = [item if not w[i] else wildcard_placeholder for i,item in enumerate(ngram)]
-                        # Insert mode
-                        else:
-                            g = []
-                            i = 0
-                            for wi in w:
-                                if wi:
-                                    g.append(wildcard_placeholder)
-                                else:
-                                    g.append(ngram[i])
-                                    i += 1
-                        ngrams.append(g)
-                    del g
-
-                # Else we just use this ngram without computing all wildcards combinations
-                else:
-                    ngrams = [ngram] # put this in a list so that we can use the same for loop
-
-                # -- Appending the ngram(s) in the patterns table
-                for ngram in ngrams:
-                    # Filter wildcards if enabled
-                    if static_wildcards:
-                        ngram = [item for i, item in enumerate(ngram) if static_wildcards[i]]
-
-                    # IMPORTANT: Computation of a unique index (id) for each n-gram
-                    # New method: compute the md5 hash of the concatenated stringified n-gram
-                    idn = str(' '.join(ngram)).lower() # stringify the n-gram by concatenating with spaces, and lowercase
-                    idn = hashlib.md5( idn ).hexdigest() # compute the md5 hash (this is our id)
-                    # Deprecated method: Compute the unique id (convert to the ASCII code representation, with fixed 3 zeros padding to avoid collisions)
-                    #idn = ''.join(['%03d' % ord(c) for c in ' '.join(ngram)])
-
-                    # If the ngram was already encountered in this text, we increment the count
-                    if patterns[idx].get(idn, None) is not None:
-                        patterns[idx][idn]['count'] += 1
-                    # Else we create a new ngram entry
+            # Text read in chunks: count the ngrams of each chunk in turn (with the end of the previous chunk)
+            if isinstance(Text, ChunkedFeatures):
+                windows = self.chunk_windows(Text, n)
+            else:
+                windows = [(Text, len(Text)-n)]
+
+            for Text, nbwindows in windows:
+                # For each n-gram
+                # Note: we place a moving start cursor (placed on the first word of each ngram)
+                for i in xrange(nbwindows):
+
+                    # -- Prepare the ngram(s)
+
+                    # Get the ngram (a simple list slice from cursor i to i+n)
+                    ngram = Text[i:i+n]
+
+                    # Sort alphabetically the ngrams if we chose to (thus we lower the number of ngrams by removing permutations, eg: [c, a, b] will be the same as [a, b, c])
+                    if tosort: ngram = sorted(ngram, key=str.lower)
+
+                    # If dynamic wildcards enabled, duplicate the ngram and generate all combinations with wildcards in different positions
+                    if dynamic_wildcards:
+                        #ngrams = [ngram[:] for x in xrange(len(wmasks))]
+                        ngrams = []
+                        for w in wmasks:
+                            # Replace mode
+                            if wildcards_mode == 'replace':
+                                g = [item if not w[i] else wildcard_placeholder for i,item in enumerate(ngram)]
+                            # Insert mode
+                            else:
+                                g = []
+                                i = 0
+                                for wi in w:
+                                    if wi:
+                                        g.append(wildcard_placeholder)
+                                    else:
+                                        g.append(ngram[i])
+                                        i += 1
+                            ngrams.append(g)
+                        del g
+
+                    # Else we just use this ngram without computing all wildcards combinations
                     else:
-                        patterns[idx][idn] = {'ngram': ngram, 'count': 1, 'freq': 0}
-                    # Compute the total count by the way
-                    totalcount += 1
+                        ngrams = [ngram] # put this in a list so that we can use the same for loop
+
+                    # -- Appending the ngram(s) in the patterns table
+                    for ngram in ngrams:
+                        # Filter wildcards if enabled
+                        if static_wildcards:
+                            ngram = [item for i, item in enumerate(ngram) if static_wildcards[i]]
+
+                        # IMPORTANT: Computation of a unique index (id) for each n-gram
+                        # New method: compute the md5 hash of the concatenated stringified n-gram
+                        idn = str(' '.join(ngram)).lower() # stringify the n-gram by concatenating with spaces, and lowercase
+                        idn = hashlib.md5( idn ).hexdigest() # compute the md5 hash (this is our id)
+                        # Deprecated method: Compute the unique id (convert to the ASCII code representation, with fixed 3 zeros padding to avoid collisions)
+                        #idn = ''.join(['%03d' % ord(c) for c in ' '.join(ngram)])
+
+                        # If the ngram was already encountered in this text, we increment the count
+                        if patterns[idx].get(idn, None) is not None:
+                            patterns[idx][idn]['count'] += 1
+                        # Else we create a new ngram entry
+                        else:
+                            patterns[idx][idn] = {'ngram': ngram, 'count': 1, 'freq': 0}
+                        # Compute the total count by the way
+                        totalcount += 1
 
         # Compute the frequencies
         for pt in patterns.itervalues(): # pt = patterns per text
@@ -178,3 +189,21 @@ class NGrams(BasePatternsExtractor):
 
         # Return the resulting variables (in a dict of vars)
         return {'Patterns': patterns}
+
+    ## Generator returning the features of a chunked text with the number of ngrams to count in each chunk, so that the ngrams spanning two chunks are counted exactly once
+    # The last n-1 features of each chunk are carried over to the beginning of the next one, and only the ngrams fully inside the chunk are counted (the next chunk counts the others). The last chunk is counted like a whole text.
+    # @param chunks ChunkedFeatures (iterable of lists of features)
+    # @param n Length of the ngrams
+    # @return gen A generator of (features, number of ngrams to count)
+    @staticmethod
+    def chunk_windows(chunks, n):
+        tokens = None
+        for chunk in chunks:
+            if tokens is not None:
+                yield (tokens, len(tokens)-n+1)
+                carry = tokens[max(0, len(tokens)-(n-1)):] if n > 1 else []
+                tokens = carry + chunk
+            else:
+                tokens = chunk
+        if tokens is not None:
+            yield (tokens, len(tokens)-n)
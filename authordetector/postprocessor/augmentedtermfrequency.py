@@ -35,6 +35,9 @@ class AugmentedTermFrequency(BasePostProcessor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = []
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -48,6 +48,9 @@ class BasePostProcessor(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'process'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['Patterns']
+
     constraints = {
         'after': 'patternsextractor'
     }
@@ -37,6 +37,9 @@ class FilterLowCount(BasePostProcessor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["filterlowcount_threshold"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
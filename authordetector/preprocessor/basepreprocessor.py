@@ -24,6 +24,10 @@
 
 from authordetector.base import BaseClass
 
+## Error raised by a preprocessor which can't process a text in a stream (the text must then be preprocessed normally, with process())
+class StreamError(Exception):
+    pass
+
 ## BasePreProcessor
 #
 # Base pre processor class that you can use as a template for other classes
@@ -48,10 +52,16 @@ class BasePreProcessor(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'process'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['Text']
+
     constraints = {
         'after': None
     }
 
+    # Size of the blocks of text output by stream()
+    blocksize = 1024*1024
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -63,3 +73,14 @@ class BasePreProcessor(BaseClass):
     # @return dict A dict containing Text, the preprocessed text
     def process(self, Text=None, *args, **kwargs):
         return {'Text': Text}
+
+    ## Preprocess a text given by blocks, and output it by blocks (used to chain the preprocessors in one streaming pass, see BaseTextReader.get_fused_text())
+    # The concatenation of the output blocks must be exactly what process() returns for the concatenation of the input blocks. If it's not possible for a given text, raise StreamError.
+    # By default, the whole text is gathered and given to process(): override this method if your preprocessor can work on parts of the text.
+    # @param blocks Iterable of blocks of text
+    # @return gen A generator producing the blocks of the preprocessed text
+    def stream(self, blocks, *args, **kwargs):
+        text = ''.join(blocks)
+        text = self.parent.generic_call(self, 'process', args={'Text': text}, return_vars=True).get('Text')
+        for i in xrange(0, len(text), self.blocksize):
+            yield text[i:i+self.blocksize]
@@ -25,6 +25,9 @@
 from authordetector.preprocessor.basepreprocessor import BasePreProcessor
 import re
 
+# Patterns already compiled in this process, by list of patterns
+_compiled = dict()
+
 ## RegexpFilter
 #
 # Strip or keep only expressions matching the given list of regular expressions
@@ -36,17 +39,36 @@ class RegexpFilter(BasePreProcessor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["regexpfilter_mode", "regexpfilter_patterns", "regexpfilter_fuse"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
         return BasePreProcessor.__init__(self, config, parent, *args, **kwargs)
 
+    ## Compile a list of patterns, only once per process
+    # @param patterns List of regexp patterns
+    # @return tuple (list of compiled patterns, fused pattern matching any of them in one scan or None if they can't be fused)
+    @staticmethod
+    def compile(patterns):
+        key = tuple(patterns)
+        if key not in _compiled:
+            compiled = [re.compile(p) for p in patterns]
+            fused = None
+            # The patterns can only be fused if they have no groups (the groups numbers and backreferences would be shifted) and the same flags (inline flags apply to the whole pattern)
+            if len(compiled) > 1 and all(c.groups == 0 and c.flags == compiled[0].flags for c in compiled):
+                fused = re.compile('|'.join('(?:%s)' % p for p in patterns))
+            _compiled[key] = (compiled, fused)
+        return _compiled[key]
+
     ## Strip or keep only expressions matching the given list of regular expressions
     # @param Text A raw text input from a reader
     # @return dict A dict containing Text, the preprocessed text
     def process(self, Text=None, *args, **kwargs):
         mode = self.config.get('regexpfilter_mode', 'strip') # either 'strip' or 'keep'
         pat = self.config.get('regexpfilter_patterns')
+        fuse = self.config.get('regexpfilter_fuse', False) # the patterns are independent: strip all of them in one scan of the text
 
         # Only if a pattern was set
         if pat is not None:
@@ -54,13 +76,19 @@ class RegexpFilter(BasePreProcessor):
             if not isinstance(pat, list):
                 pat = [pat]
 
-            # Compare the text to each pattern
-            for p in pat:
-                # Strip mode: we remove all occurrences
-                if mode == 'strip':
-                    Text = re.sub(p, '', Text)
-                # Keep mode: we recursively keep only the patterns found
-                else:
-                    Text = ' '.join(re.findall(p, Text))
+            (compiled, fused) = self.compile(pat)
+
+            # Strip mode with independent patterns: remove the occurrences of all the patterns at once
+            if mode == 'strip' and fuse and fused is not None:
+                Text = fused.sub('', Text)
+            else:
+                # Compare the text to each pattern (the text is not copied when a pattern does not match)
+                for c in compiled:
+                    # Strip mode: we remove all occurrences
+                    if mode == 'strip':
+                        Text = c.sub('', Text)
+                    # Keep mode: we recursively keep only the patterns found
+                    else:
+                        Text = ' '.join(c.findall(Text))
 
         return {'Text': Text}
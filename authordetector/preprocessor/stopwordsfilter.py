@@ -22,10 +22,53 @@
 #
 # Strip or keep only the stopwords, given a list of stopwords
 
+from authordetector.base import stat_file
 from authordetector.preprocessor.basepreprocessor import BasePreProcessor
 import re
 import codecs
 
+## StopWordsMatcher
+#
+# Find the stopwords of a text in linear time: the text is split into words, and each word is looked up in a set of stopwords (so the cost per text does not depend on the number of stopwords).
+# The rare stopwords that are not a single word (eg: "c'est", "parce que") are matched by a regexp.
+class StopWordsMatcher(object):
+
+    # Words of a text
+    wordpat = re.compile(r'\w+', re.U)
+
+    ## Constructor
+    # @param slist List of stopwords (unicode)
+    def __init__(self, slist):
+        words = set()
+        others = list()
+        for s in slist:
+            m = self.wordpat.match(s)
+            if m and m.end() == len(s):
+                words.add(s.lower())
+            else:
+                others.append(re.escape(s))
+        self.words = frozenset(words)
+        self.otherpat = re.compile(r'\b('+'|'.join(others)+r')\b', re.I | re.U) if others else None
+
+    ## Find the stopwords of a text
+    # @param text Text (unicode)
+    # @return list List of (start, end) spans of the stopwords, in order and without overlap
+    def spans(self, text):
+        words = self.words
+        spans = [m.span() for m in self.wordpat.finditer(text) if m.group().lower() in words]
+        if self.otherpat is not None:
+            others = [m.span() for m in self.otherpat.finditer(text)]
+            if others:
+                merged = list()
+                for span in sorted(spans + others):
+                    if not merged or span[0] >= merged[-1][1]:
+                        merged.append(span)
+                spans = merged
+        return spans
+
+# Stopwords matchers already loaded in this process, by (file path, size, modification time, charset)
+_matchers = dict()
+
 ## StopWordsFilter
 #
 # Strip or keep only the stopwords, given a list of stopwords
@@ -37,11 +80,34 @@ class StopWordsFilter(BasePreProcessor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["reader_charset", "stopwordsfilter_mode", "stopwordsfilter_file"]
+
+    # Config keys of the files read by this module
+    configfiles = ["stopwordsfilter_file"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
         return BasePreProcessor.__init__(self, config, parent, *args, **kwargs)
 
+    ## Return the stopwords matcher for a stopwords file: the file is read and compiled only once per process (and again if it is modified)
+    # @param path Path to the file containing the stopwords (one per line)
+    # @param charset Charset of the file
+    # @return StopWordsMatcher
+    @staticmethod
+    def get_matcher(path, charset):
+        key = stat_file(path) + (charset,)
+        if key not in _matchers:
+            slist = []
+            with codecs.open(path, 'r', encoding=charset) as f:
+                for s in f: # for each line (stopword) in the file
+                    s = s.strip() # trip empty spaces
+                    if len(s) > 0: # check that the line is not empty
+                        slist.append(s)
+            _matchers[key] = StopWordsMatcher(slist)
+        return _matchers[key]
+
     ## Strip or keep only the stopwords, given a list of stopwords
     # @param Text A raw text input from a reader
     # @return dict A dict containing Text, the preprocessed text
@@ -51,20 +117,73 @@ class StopWordsFilter(BasePreProcessor):
         stopwords = self.config.get('stopwordsfilter_file') # path to the file containing the stopwords
 
         if stopwords is not None:
-            slist = []
-            with codecs.open(stopwords, 'r', encoding=charset) as f:
-                for s in f: # for each line (stopword) in the file
-                    s = s.strip() # trip empty spaces
-                    if len(s) > 0: # check that the line is not empty
-                        slist.append(s)
-
-            # Compile all the words in a single regexp
-            pat = re.compile(r'\b('+'|'.join(slist)+r')\b', re.I)
-            # Strip mode: we remove all stopwords
-            if mode == 'strip':
-                Text = pat.sub('', Text)
-            # Keep mode: keep only stopwords and remove all the other words
-            else:
-                Text = ' '.join(pat.findall(Text))
+            Text = self.filter(Text, self.get_matcher(stopwords, charset), mode, charset)
 
         return {'Text': Text}
+
+    ## Strip or keep only the stopwords of a text
+    # @param Text Text (encoded in charset, or unicode)
+    # @param matcher StopWordsMatcher
+    # @param mode 'strip' or 'keep'
+    # @param charset Charset of the text
+    # @return string Filtered text, always encoded in charset (the next modules expect str, eg: NGrams)
+    @staticmethod
+    def filter(Text, matcher, mode, charset):
+        # Find the stopwords in the decoded text (so that the non-ascii stopwords are matched too)
+        text = Text.decode(charset) if not isinstance(Text, unicode) else Text
+        spans = matcher.spans(text)
+
+        # Strip mode: we remove all stopwords
+        if mode == 'strip':
+            parts = []
+            pos = 0
+            for (start, end) in spans:
+                parts.append(text[pos:start])
+                pos = end
+            parts.append(text[pos:])
+            text = u''.join(parts)
+        # Keep mode: keep only stopwords and remove all the other words
+        else:
+            text = u' '.join([text[start:end] for (start, end) in spans])
+
+        return text.encode(charset)
+
+    ## Strip or keep only the stopwords of a text given by blocks
+    # The blocks are cut again after their last whitespace, so that no word is split between two blocks. This is only possible when the stopwords are all single words and the charset is ascii-compatible, else the whole text is processed at once.
+    # @param blocks Iterable of blocks of text
+    # @return gen A generator producing the blocks of the filtered text
+    def stream(self, blocks, *args, **kwargs):
+        charset = self.config.get("reader_charset", 'utf-8')
+        mode = self.config.get('stopwordsfilter_mode', 'strip')
+        stopwords = self.config.get('stopwordsfilter_file')
+
+        if stopwords is None:
+            for block in blocks:
+                yield block
+            return
+        matcher = self.get_matcher(stopwords, charset)
+        if matcher.otherpat is not None or u'\n \t\r'.encode(charset) != '\n \t\r':
+            for block in BasePreProcessor.stream(self, blocks):
+                yield block
+            return
+
+        rest = ''
+        emitted = False # in keep mode, the stopwords of two blocks are separated by a space
+        for block in blocks:
+            block = rest + block
+            cut = max(block.rfind(sep) for sep in (' ', '\n', '\t', '\r')) + 1
+            (block, rest) = (block[:cut], block[cut:])
+            if block:
+                out = self.filter(block, matcher, mode, charset)
+                if mode != 'strip' and out:
+                    if emitted:
+                        out = ' ' + out
+                    emitted = True
+                if out:
+                    yield out
+        if rest:
+            out = self.filter(rest, matcher, mode, charset)
+            if mode != 'strip' and out and emitted:
+                out = ' ' + out
+            if out:
+                yield out
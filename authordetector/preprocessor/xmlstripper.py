@@ -22,8 +22,8 @@
 #
 # Strip xml tags from the text
 
-from authordetector.preprocessor.basepreprocessor import BasePreProcessor
-import xml.etree.ElementTree as ET
+from authordetector.preprocessor.basepreprocessor import BasePreProcessor, StreamError
+import xml.parsers.expat
 
 ## XMLStripper
 #
@@ -36,6 +36,9 @@ class XMLStripper(BasePreProcessor):
     ## @var parent
     # A reference to the parent object (Runner)
 
+    # Config keys read by this module
+    configkeys = ["reader_charset", "xmlstripper_drop", "xmlstripper_keep"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -43,14 +46,63 @@ class XMLStripper(BasePreProcessor):
 
     ## Strip xml tags from the text
     # Reliably strip xml tags using xml parser (instead of regexp), but the input must be a correctly formatted xml
+    # The text is parsed incrementally (SAX-style, no tree is built in memory) and the text content is output as it is parsed, so the memory used by the parser does not depend on the size of the document.
     # @param Text A raw text input from a reader
     # @return dict A dict containing Text, the preprocessed text
     def process(self, Text=None, *args, **kwargs):
         try:
-            tree = ET.fromstring(Text)
-            notags = ET.tostring(tree, encoding='utf8', method='text')
-            return {'Text': notags}
+            return {'Text': ''.join(self.stream(Text[i:i+self.blocksize] for i in xrange(0, len(Text), self.blocksize)))}
         except Exception as e:
-            print("XMLStripper failed. Maybe there's no XML in this text?")
-            pass
+            # Stop at the first error (the rest of the text is not parsed) and return the text as-is
+            print("XMLStripper failed (%s). Maybe there's no XML in this text?" % e)
             return {'Text': Text}
+
+    ## Strip xml tags from a text given by blocks, and output the text content of each block as soon as it is parsed
+    # @param blocks Iterable of blocks of text
+    # @return gen A generator producing the blocks of text content
+    def stream(self, blocks, *args, **kwargs):
+        charset = self.config.get("reader_charset", 'utf-8')
+        drop = set(self.config.get("xmlstripper_drop") or []) # names of the elements to drop with all their content (eg: note, teiHeader)
+        keep = set(self.config.get("xmlstripper_keep") or []) # if set, keep only the content of these elements
+
+        out = list()
+        depth = {'drop': 0, 'keep': 0} # number of opened elements to drop (including their children) and to keep
+
+        # Name of an element without its namespace prefix (eg: tei:note -> note)
+        def localname(name):
+            return name.rsplit(':', 1)[-1]
+
+        def start(name, attrs):
+            name = localname(name)
+            if depth['drop'] or name in drop:
+                depth['drop'] += 1
+            if name in keep:
+                depth['keep'] += 1
+
+        def end(name):
+            name = localname(name)
+            if depth['drop']:
+                depth['drop'] -= 1
+            if name in keep:
+                depth['keep'] -= 1
+
+        def data(text):
+            if not depth['drop'] and (depth['keep'] or not keep):
+                out.append(text.encode(charset))
+
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True # merge the consecutive character data (less calls)
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+        try:
+            for block in blocks:
+                parser.Parse(block, False)
+                if out:
+                    yield ''.join(out)
+                    del out[:]
+            parser.Parse('', True)
+        except (xml.parsers.expat.ExpatError, UnicodeError, ValueError) as e: # malformed xml, or text content that can't be encoded in reader_charset
+            raise StreamError(str(e))
+        if out:
+            yield ''.join(out)
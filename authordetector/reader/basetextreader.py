@@ -25,8 +25,17 @@
 
 from authordetector.base import BaseClass
 from authordetector.configparser import ConfigParser
+from authordetector.diskcache import DiskCache
+from authordetector.preprocessor.basepreprocessor import StreamError
+from authordetector import archives
+from authordetector import minhash
+from authordetector import manifest
 import os
 import codecs
+import hashlib
+import mmap
+import collections
+from multiprocessing.pool import ThreadPool
 
 ## BaseTextReader
 #
@@ -41,11 +50,20 @@ class BaseTextReader(BaseClass):
     # A reference to the parent object (Runner)
 
     ## @var textconfig
-    # Contains the text configuration parameters from the textconfig file
+    # Contains the text configuration parameters from the textconfig file (a ConfigParser for a JSON file, or a manifest.Manifest for a JSONL file)
 
     ## @var textrootdir
     # Root directory where the text files reside (can be relative or absolute)
 
+    ## @var selection
+    # List of indexes of the texts to return in get_all_texts() (None to return all texts). Used to stream the texts one at a time through the workflow.
+
+    ## @var memtexts
+    # List of texts given directly in memory (see set_texts()), instead of the texts files listed in the textconfig (None)
+
+    ## @var archiveset
+    # Archives opened to read the texts stored inside archives (see archives.ArchiveSet), or None if no text is inside an archive
+
     # Define what can be returned by this type of module relative to the input data. Or said differently: what will this kind of module _may_ do with the input data? (they may but some modules may do less or more).
     # You should define this in the base class of each category of modules.
     # Flags: transform = transform an input variable into a new variable (with a new name and new datatype) - add: add new variables in addition to input - change: return the same variables (with same datatype) as input but changed
@@ -62,11 +80,26 @@ class BaseTextReader(BaseClass):
         'after': None
     }
 
+    # Size of the blocks of raw text read when preprocessing in a stream (see get_fused_text())
+    blocksize = 1024*1024
+
+    # Config keys read by this module (the texts configs and files are accounted for in fingerprint())
+    configkeys = ["reader_charset", "reader_mmap", "reader_chunksize", "textrootdir"]
+
+    # The texts are in the fingerprint of the reader, and the prefetching does not change them
+    runtimekeys = ["textconfig", "textconfig_detection", "reader_prefetch", "reader_prefetch_maxsize"]
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
         C = BaseClass.__init__(self, config, parent, *args, **kwargs)
         self.__dict__['textconfig'] = ConfigParser()
+        self.selection = None
+        self.memtexts = None
+        self.corpusfingerprint = None
+        self.hashes = dict() # (filepath, (size, mtime)) -> md5 of the content
+        self.archiveset = None
+        self.archivepaths = dict() # idx -> (archive path, member) or None
         self.reloadconfig()
 
         return C
@@ -79,6 +112,10 @@ class BaseTextReader(BaseClass):
         if not isinstance(idx, int) or idx < 0:
             raise Exception("Index is expected to be a positive integer")
 
+        # Texts in memory have no parameters
+        if self.memtexts is not None:
+            return {'file': None}
+
         return self.textconfig.get(idx)
 
     ## Return the filepath of a text for a given index
@@ -87,24 +124,147 @@ class BaseTextReader(BaseClass):
     def get_filepath(self, idx, *args, **kwargs):
         return os.path.join(self.textrootdir, self.get_params(idx)['file'])
 
+    ## Return the archive containing a text, if the text is inside an archive (eg: file = corpus.tar.gz/authorA/text1.txt)
+    # @param idx Index of the text
+    # @return tuple (archive path, member name), or None if the text is a plain file
+    def get_archive(self, idx, *args, **kwargs):
+        if self.memtexts is not None:
+            return None
+        if idx not in self.archivepaths:
+            self.archivepaths[idx] = archives.split_path(self.get_filepath(idx))
+            if self.archivepaths[idx] is not None and self.archiveset is None:
+                self.open_archives()
+        return self.archivepaths[idx]
+
+    ## Prepare the reading of the texts inside archives: the members of all the texts are declared, so that the tar archives can be read in only one pass even if the texts are not listed in the same order as in the archive
+    def open_archives(self, *args, **kwargs):
+        self.archiveset = archives.ArchiveSet(int(float(self.config.get('reader_archive_buffer', 64)) * 1024 * 1024))
+        for idx in xrange(len(self)):
+            archive = self.get_archive(idx)
+            if archive is not None:
+                self.archiveset.want(archive[0], [archive[1]])
+
     ## Return the raw text for a given index
     # @param idx Index of the text
     # @return string Full raw text (no preprocessing)
     def get_raw_text(self, idx, *args, **kwargs):
         charset = self.config.get("reader_charset", 'utf-8')
+        # Text in memory
+        if self.memtexts is not None:
+            text = self.memtexts[idx]
+            if isinstance(text, unicode):
+                text = text.encode(charset) # encode in the specified charset, like the texts read from files
+            return text
+        # Text inside an archive, read directly from the archive (in memory)
+        archive = self.get_archive(idx)
+        if archive is not None:
+            text = self.archiveset.read(*archive)
+            if self.config.get("reader_mmap", False):
+                return text
+            return text.decode(charset).encode(charset) # check the charset like for the texts files
+        # Memory-mapped mode: the bytes are copied only once from the mapped file, without decoding them into unicode and encoding them back in the same charset (the file must already be in reader_charset, the stages that need unicode decode the text themselves)
+        if self.config.get("reader_mmap", False):
+            buf = self.get_raw_buffer(idx)
+            try:
+                return buf[:]
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
         with codecs.open(self.get_filepath(idx), 'rb', encoding=charset) as f:
             text = f.read()
             text = text.encode(charset) # encode in the specified charset
         return text
 
     ## Return the preprosseced text for a given index
+    # The preprocessed texts are stored in the preprocessed texts cache of the Runner (if enabled), so that unchanged texts are not preprocessed again at the next run
     # @param idx Index of the text
     # @return string Full preprocessed text
     def get_preprocessed_text(self, idx, *args, **kwargs):
-        text = self.get_raw_text(idx)
-        if self.parent.__dict__.get('preprocessor', None):
-            dictofvars = self.parent.generic_call(self.parent.preprocessor, 'process', args={'Text': text}, return_vars=True)
-        return dictofvars.get('Text')
+        if not self.parent.__dict__.get('preprocessor', None):
+            return self.get_raw_text(idx)
+
+        # Try to load from the cache (except for the texts given in memory, which must be processed without touching the disk, see Runner.detect_texts())
+        cache = self.parent.__dict__.get('textcache', None)
+        if self.memtexts is not None:
+            cache = None
+        if cache is not None:
+            key = self.get_preprocessed_key(idx)
+            text = cache.get(key)
+            if text is not None:
+                return text
+
+        text = None
+        if self.config.get('preprocessor_fused', False):
+            text = self.get_fused_text(idx)
+        if text is None:
+            # The raw text is not kept here, so that it can be freed as soon as the first preprocessor returned its output
+            dictofvars = self.parent.generic_call(self.parent.preprocessor, 'process', args={'Text': self.get_raw_text(idx)}, return_vars=True)
+            text = dictofvars.get('Text')
+
+        if cache is not None:
+            cache.set(key, text)
+        return text
+
+    ## Preprocess a text in one streaming pass through all the preprocessors (see BasePreProcessor.stream()): the raw text is read by blocks from the memory-mapped file, and each block goes through the whole chain of preprocessors before the next one is read, so that only the final output is fully in memory
+    # The result is identical to calling the preprocessors one after the other
+    # @param idx Index of the text
+    # @return string Full preprocessed text, or None if a preprocessor can't process this text in a stream (eg: XMLStripper on a malformed document), then the text must be preprocessed normally
+    def get_fused_text(self, idx, *args, **kwargs):
+        preprocessor = self.parent.preprocessor
+        if isinstance(preprocessor, dict):
+            preprocessors = preprocessor.values()
+        else:
+            preprocessors = [preprocessor]
+        buf = self.get_raw_buffer(idx)
+        try:
+            blocks = self.get_raw_blocks(buf, check=(self.memtexts is None and not self.config.get("reader_mmap", False)))
+            for p in preprocessors:
+                blocks = p.stream(blocks)
+            return ''.join(blocks)
+        except StreamError:
+            return None
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    ## Generator returning the raw bytes of a text by blocks
+    # @param buf String or mmap of the raw text (see get_raw_buffer())
+    # @param check Check that the text is correctly encoded in reader_charset (as get_raw_text() does)
+    # @return gen A generator producing blocks of blocksize bytes
+    def get_raw_blocks(self, buf, check=True, *args, **kwargs):
+        decoder = codecs.getincrementaldecoder(self.config.get("reader_charset", 'utf-8'))() if check else None
+        for i in xrange(0, len(buf), self.blocksize):
+            block = buf[i:i+self.blocksize]
+            if decoder is not None:
+                decoder.decode(block, False)
+            yield block
+        if decoder is not None:
+            decoder.decode('', True)
+
+    ## Compute the key of a preprocessed text in the cache: file size, modification time and content hash, plus the reader and preprocessors config
+    # @param idx Index of the text
+    # @return string Hex digest
+    def get_preprocessed_key(self, idx, *args, **kwargs):
+        if self.memtexts is not None:
+            stat = None
+            md5 = self.get_hash(idx)
+        else:
+            stat = self.get_stat(idx)
+            # Remember the hashes of the files, to hash them only once per run
+            hashkey = (self.get_filepath(idx), stat)
+            md5 = self.hashes.get(hashkey)
+            if md5 is None:
+                md5 = self.hashes[hashkey] = self.get_hash(idx)
+        return DiskCache.hash([stat, md5, self.get_settings()])
+
+    ## Compute a key of a text without reading it: file path, size and modification time, plus the reader and preprocessors config (used by the corpus store, see get_preprocessed_key() for a key based on the content)
+    # Texts in memory are identified by their content hash.
+    # @param idx Index of the text
+    # @return string Hex digest
+    def get_stat_key(self, idx, *args, **kwargs):
+        if self.memtexts is not None:
+            return self.get_preprocessed_key(idx)
+        return DiskCache.hash([self.get_params(idx)['file'], self.get_stat(idx), repr(self.get_settings())]) # hashed by repr, see BaseFeaturesExtractor.get_store_key()
 
     ## Wrapper function that, for a given text index, will return either the raw text or either the preprocessed text, depending if a preprocessor was configured
     # NOTICE: this method MUST be implemented in all readers!
@@ -120,12 +280,256 @@ class BaseTextReader(BaseClass):
     # NOTICE: this method MUST be implemented in all readers!
     # @return gen A generator producing one text for each access
     def get_all_texts(self, *args, **kwargs):
-        for idx in xrange(len(self.parent.reader)):
+        idxs = self.get_indexes()
+        # Prefetch the next texts in background threads
+        depth = int(self.config.get('reader_prefetch', 0) or 0)
+        if depth > 0 and len(idxs) > 1:
+            for text in self.prefetch_texts(idxs, depth):
+                yield text
+            return
+        for idx in idxs:
             yield self.get_text(idx)
 
+    ## Return the indexes of the texts that get_all_texts() will return (the selection, or all the texts)
+    # @return list List of indexes
+    def get_indexes(self, *args, **kwargs):
+        if self.selection is not None:
+            return self.selection
+        return xrange(len(self.parent.reader))
+
+    ## Return the size of the chunks the texts must be read in (see get_text_chunks())
+    # @return int Size of the chunks in bytes, or 0 if the texts are read whole
+    def get_chunksize(self, *args, **kwargs):
+        return int(float(self.config.get('reader_chunksize', 0) or 0) * 1024 * 1024)
+
+    ## Generator returning a text as a sequence of preprocessed chunks of about reader_chunksize bytes, split at sentence boundaries, so that the whole text is never loaded in memory (the file is memory-mapped)
+    # The chunks do not overlap: the stages that need the context of the previous chunk (eg: ngrams spanning two chunks) must carry it over themselves, see NGrams.
+    # Note: the preprocessors are applied on each chunk separately, so they must not need the whole text at once (eg: XMLStripper needs a well-formed document). The preprocessed chunks are not cached.
+    # @param idx Index of the text
+    # @return gen A generator producing one chunk for each access
+    def get_text_chunks(self, idx, *args, **kwargs):
+        preprocessor = self.parent.__dict__.get('preprocessor', None)
+        buf = self.get_raw_buffer(idx)
+        try:
+            for (start, end) in self.split_chunks(buf, self.get_chunksize()):
+                chunk = buf[start:end]
+                if preprocessor:
+                    dictofvars = self.parent.generic_call(preprocessor, 'process', args={'Text': chunk}, return_vars=True)
+                    chunk = dictofvars.get('Text')
+                yield chunk
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    ## Compute the boundaries of the chunks of a text: each chunk ends after the last end of sentence before the size limit, or else after the last whitespace, or else at the limit (but never inside an utf-8 character)
+    # @param buf String or mmap of the raw text
+    # @param chunksize Maximum size of a chunk in bytes (0 for only one chunk)
+    # @return gen A generator of (start, end) offsets
+    @staticmethod
+    def split_chunks(buf, chunksize):
+        size = len(buf)
+        start = 0
+        while start < size:
+            end = start + chunksize
+            if chunksize <= 0 or end >= size:
+                yield (start, size)
+                return
+            cut = max(buf.rfind(sep, start, end) + len(sep) for sep in ('. ', '! ', '? ', '.\n', '!\n', '?\n', '\n\n'))
+            if cut <= start + 1: # no end of sentence, cut at the last whitespace
+                cut = max(buf.rfind(sep, start, end) + 1 for sep in (' ', '\t', '\n'))
+            if cut <= start + 1: # no whitespace at all, cut at the limit
+                cut = end
+                while cut > start + 1 and 0x80 <= ord(buf[cut]) < 0xC0: # don't cut in the middle of an utf-8 multibyte character
+                    cut -= 1
+            yield (start, cut)
+            start = cut
+
+    ## Generator returning the texts in order, while the next texts are read and preprocessed in background threads (so that the reading overlaps with the processing of the current text, eg: tagging)
+    # The records of the stages profiler for the preprocessing of each text are added by the main thread when the text is returned
+    # @param idxs List of indexes of the texts
+    # @param depth Maximum number of texts read in advance
+    # @return gen A generator producing one text for each access
+    def prefetch_texts(self, idxs, depth, *args, **kwargs):
+        idxs = list(idxs)
+        maxsize = float(self.config.get('reader_prefetch_maxsize', 256)) * 1024 * 1024 # memory cap of the texts read in advance (estimated from the files sizes)
+        profiler = self.parent.__dict__.get('profiler', None)
+        pool = ThreadPool(min(depth, len(idxs)))
+        pending = collections.deque() # (size, AsyncResult) of the texts being read, in order
+        pendingsize = 0
+        nextidx = 0
+        try:
+            while nextidx < len(idxs) or pending:
+                # Launch the reading of the next texts, within the depth and the memory cap (but always at least one)
+                while nextidx < len(idxs) and len(pending) < depth:
+                    size = self.get_size(idxs[nextidx])
+                    if pending and pendingsize + size > maxsize:
+                        break
+                    if profiler is not None:
+                        pending.append((size, pool.apply_async(profiler.capture, (self.get_text, idxs[nextidx]))))
+                    else:
+                        pending.append((size, pool.apply_async(self.get_text, (idxs[nextidx],))))
+                    pendingsize += size
+                    nextidx += 1
+                # Return the oldest one (waiting for it if needed)
+                (size, result) = pending.popleft()
+                pendingsize -= size
+                if profiler is not None:
+                    (text, records) = result.get()
+                    profiler.records.extend(records)
+                    yield text
+                else:
+                    yield result.get()
+        finally:
+            pool.terminate()
+
+    ## Return the size in bytes of a raw text (without reading it)
+    # @param idx Index of the text
+    def get_size(self, idx, *args, **kwargs):
+        if self.memtexts is not None:
+            return len(self.memtexts[idx])
+        archive = self.get_archive(idx)
+        if archive is not None:
+            return self.archiveset.size(*archive) or 0 # the size of the members of tar archives is only known once the stream went past them
+        try:
+            return os.path.getsize(self.get_filepath(idx))
+        except OSError:
+            return 0
+
+    ## Return the size and modification time of a text file (of the archive for the texts inside an archive)
+    # @param idx Index of the text
+    # @return tuple (size, mtime)
+    def get_stat(self, idx, *args, **kwargs):
+        archive = self.get_archive(idx)
+        st = os.stat(archive[0] if archive is not None else self.get_filepath(idx))
+        return (st.st_size, st.st_mtime)
+
+    ## Use texts given in memory instead of the texts files listed in the textconfig (nothing is read from the disk)
+    # @param texts List of texts (strings), or None to go back to the texts listed in the textconfig
+    def set_texts(self, texts=None, *args, **kwargs):
+        if texts is not None:
+            texts = list(texts)
+        self.memtexts = texts
+        self.selection = None
+        self.corpusfingerprint = None
+
+    ## Restrict the texts returned by get_all_texts() to a list of indexes
+    # @param idxs List of indexes of texts, or None to return all texts again
+    def select(self, idxs=None, *args, **kwargs):
+        if idxs is not None:
+            idxs = list(idxs)
+        self.selection = idxs
+
+    ## Return a read-only buffer over the raw bytes of a text (not decoded), without copying it in memory: the file is memory-mapped
+    # The stages that can work on a buffer (eg: hashing, searching) can use it instead of get_raw_text() to avoid loading the whole text in memory.
+    # @param idx Index of the text
+    # @return mmap A read-only mmap object (the caller should close() it), or a string for empty files (they can't be mapped), texts in memory and texts inside archives
+    def get_raw_buffer(self, idx, *args, **kwargs):
+        if self.memtexts is not None:
+            return self.get_raw_text(idx)
+        if self.get_archive(idx) is not None:
+            return self.archiveset.read(*self.get_archive(idx))
+        with open(self.get_filepath(idx), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+
+    ## Return the md5 hash of the content of a text file (used to know if a text was already learned)
+    # @param idx Index of the text
+    # @return string Hex digest
+    def get_hash(self, idx, *args, **kwargs):
+        buf = self.get_raw_buffer(idx)
+        try:
+            return hashlib.md5(buf).hexdigest()
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+
+    ## Compute a fingerprint of how the texts are read: reader, preprocessors and their config (but not the texts themselves)
+    # @return list Parts of the fingerprint (picklable)
+    def get_settings(self, *args, **kwargs):
+        parts = [self.__class__.__name__, self.get_config_values()]
+        preprocessor = self.parent.__dict__.get('preprocessor', None)
+        if preprocessor:
+            if isinstance(preprocessor, dict):
+                preprocessors = preprocessor.values()
+            else:
+                preprocessors = [preprocessor]
+            parts.append([(p.__class__.__name__, p.get_config_values()) for p in preprocessors])
+        return parts
+
+    ## Compute a fingerprint of the texts that get_all_texts() will return: texts configs, files sizes and modification times, preprocessors and their config
+    # This is used in the keys of the stages cache, since the featuresextractors fetch the texts directly from the reader and not from the vars
+    # A JSONL manifest is fingerprinted as a whole (see manifest.ManifestEntries.fingerprint()) without parsing its entries nor reading the sizes of the texts files: touch the manifest when a text file is edited in place.
+    # @return string Hex digest
+    def fingerprint(self, *args, **kwargs):
+        # Fingerprint of the whole corpus, computed only once per config (reloadconfig() resets it)
+        if self.corpusfingerprint is None:
+            parts = self.get_settings()
+            if self.memtexts is None and isinstance(self.textconfig.config, manifest.ManifestEntries):
+                parts.append(self.textconfig.config.fingerprint())
+            else:
+                for idx in xrange(len(self)):
+                    if self.memtexts is not None:
+                        parts.append(self.get_hash(idx))
+                        continue
+                    try:
+                        stat = self.get_stat(idx)
+                    except OSError:
+                        stat = None
+                    parts.append((sorted(self.get_params(idx).items()), stat))
+            self.corpusfingerprint = DiskCache.hash(parts)
+        # Add the current selection of texts
+        return DiskCache.hash([self.corpusfingerprint, self.selection])
+
+    ## Remove the duplicated texts from the list of texts, and report the near-duplicates
+    # Each text is fingerprinted with the md5 hash of its content (exact duplicates, only the first occurrence is kept) and with a MinHash signature of its shingles (near-duplicates: eg: another edition of the same work), compared with LSH. This is done on the raw texts, before any preprocessing or features extraction.
+    # @return tuple (list of indexes of the removed texts, list of (index1, index2, similarity) of the near-duplicates), indexes before the removal
+    def dedup(self, *args, **kwargs):
+        charset = self.config.get("reader_charset", 'utf-8')
+        threshold = float(self.config.get('reader_dedup_threshold', 0.8) or 0) # Jaccard similarity above which two texts are reported as near-duplicates (0 to disable)
+        mh = minhash.MinHash(permutations=int(self.config.get('reader_dedup_permutations', 128)), shingles=int(self.config.get('reader_dedup_shingles', 5)))
+
+        seen = dict() # md5 -> index of the first text with this content
+        removed = list()
+        kept = list()
+        signatures = list()
+        for idx in xrange(len(self)):
+            text = self.get_raw_text(idx)
+            md5 = hashlib.md5(text).hexdigest()
+            if md5 in seen:
+                print("Skipping text %s (%s): exact duplicate of text %s (%s)." % (idx, self.get_params(idx).get('file'), seen[md5], self.get_params(seen[md5]).get('file')))
+                removed.append(idx)
+                continue
+            seen[md5] = idx
+            kept.append(idx)
+            if threshold > 0:
+                signatures.append(mh.signature(text.decode(charset, 'replace')))
+            del text
+
+        near = list()
+        if threshold > 0:
+            for (i, j, similarity) in minhash.near_duplicates(signatures, threshold):
+                (i, j) = (kept[i], kept[j])
+                near.append((i, j, similarity))
+                print("WARNING: texts %s (%s) and %s (%s) are near-duplicates (estimated similarity: %.2f)." % (i, self.get_params(i).get('file'), j, self.get_params(j).get('file'), similarity))
+
+        # Remove the exact duplicates from the texts list
+        if removed:
+            if self.memtexts is not None:
+                self.memtexts = [self.memtexts[idx] for idx in kept]
+            else:
+                self.textconfig.config = [self.textconfig.config[idx] for idx in kept]
+            self.selection = None
+            self.corpusfingerprint = None
+            self.archivepaths = dict()
+        print("Deduplication: %s exact duplicate(s) skipped, %s near-duplicate pair(s) found, %s text(s) left." % (len(removed), len(near), len(self)))
+        return (removed, near)
+
     ## Return the total number of texts specified in the textconfig
     # NOTICE: this method MUST be implemented in all readers!
     def __len__(self, *args, **kwargs):
+        if self.memtexts is not None:
+            return len(self.memtexts)
         return len(self.textconfig.config)
 
     ## Return the total number of texts specified in the textconfig
@@ -134,8 +538,21 @@ class BaseTextReader(BaseClass):
 
     def reloadconfig(self, *args, **kwargs):
         if self.parent.vars.get("Mode", 'Learning') == 'Learning':
-            self.textconfig.init(configfile=self.config.get("textconfig"))
+            configfile = self.config.get("textconfig")
         else:
-            self.textconfig.init(configfile=self.config.get("textconfig_detection"))
+            configfile = self.config.get("textconfig_detection")
+        # JSONL manifest (one text per line, parsed lazily) or JSON list of texts
+        if manifest.is_manifest(configfile):
+            if not isinstance(self.textconfig, manifest.Manifest):
+                self.__dict__['textconfig'] = manifest.Manifest()
+        elif isinstance(self.textconfig, manifest.Manifest):
+            self.__dict__['textconfig'] = ConfigParser()
+        self.textconfig.init(configfile=configfile)
         self.textconfig.load(comments=True)
         self.textrootdir = os.path.abspath(self.config.get("textrootdir"))
+        self.memtexts = None
+        self.corpusfingerprint = None
+        if self.archiveset is not None:
+            self.archiveset.close()
+        self.archiveset = None
+        self.archivepaths = dict()
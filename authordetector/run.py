@@ -20,7 +20,14 @@
 
 from auxlib import *
 from authordetector.configparser import ConfigParser
+from authordetector import parallel
+from authordetector.diskcache import DiskCache
+from authordetector.stageprofiler import StageProfiler
+from authordetector.checkpoint import Checkpoint
+from authordetector.corpusstore import CorpusStore
+from authordetector.namespace import Namespace, get_argnames, get_kwargs
 import os, sys, StringIO
+import glob
 import pandas as pd
 import time
 import traceback
@@ -36,6 +43,9 @@ class Runner:
 
     rootdir = 'authordetector'
 
+    # Config keys read by the Runner (and the commandline flags) that change how the routine is run but not what the modules compute, see BaseClass.get_runtime_keys()
+    runtimekeys = ['help', 'interactive', 'script', 'config', 'textroot', 'learn', 'batch', 'batch_workers', 'parametersfile', 'resultsfile', 'debug', 'cache', 'no_cache', 'cache_dir', 'cache_maxsize', 'preprocessed_cache', 'preprocessed_cache_maxsize', 'treetagger_cache', 'treetagger_cache_maxsize', 'profile_stages', 'parallel_workers', 'workflow_scheduler', 'learn_streaming', 'learn_incremental', 'checkpoint', 'checkpoint_file', 'resume', 'compile_corpus', 'corpus_store']
+
     ## @var vars contain a dynamical dict of variables used for data mining, and will be passed to every other computational function
     vars = {} # we create a reference at startup so that this dict can be passed as a reference to children objects
 
@@ -50,6 +60,32 @@ class Runner:
         self.config.init(configfile)
         self.config.load(args, extras, comments=True)
 
+        #-- Stages cache
+        self.cache = None
+        self.textcache = None
+        self.tagcache = None
+        if self.config.get('cache', False) and not self.config.get('no_cache', False):
+            self.cache = DiskCache(self.config.get('cache_dir', 'cache'), maxsize=int(float(self.config.get('cache_maxsize', 2048)) * 1024 * 1024))
+            # Preprocessed texts cache (used by the reader)
+            if self.config.get('preprocessed_cache', True):
+                self.textcache = DiskCache(os.path.join(self.config.get('cache_dir', 'cache'), 'preprocessed'), maxsize=int(float(self.config.get('preprocessed_cache_maxsize', 1024)) * 1024 * 1024))
+            # Tagger output cache (used by the TreeTagger features extractor)
+            if self.config.get('treetagger_cache', True):
+                self.tagcache = DiskCache(os.path.join(self.config.get('cache_dir', 'cache'), 'treetagger'), maxsize=int(float(self.config.get('treetagger_cache_maxsize', 1024)) * 1024 * 1024))
+
+        #-- Stages profiler
+        self.profiler = None
+        if self.config.get('profile_stages', False):
+            self.profiler = StageProfiler(memory=(self.config.get('profile_stages') == 'memory'))
+
+        #-- Checkpoints (only used by learn())
+        self.checkpoint = None
+
+        #-- Corpus store (the tokens streams of the texts compiled with --compile_corpus)
+        self.corpusstore = None
+        if self.config.get('corpus_store') and os.path.isfile(os.path.join(self.config.get('corpus_store'), 'index.pkl')):
+            self.corpusstore = CorpusStore(self.config.get('corpus_store'))
+
         #-- Loading classes
         for (submod, classname) in self.config.config["classes"].iteritems(): # for each item/module specified in classes
             localname = submod
@@ -142,6 +178,9 @@ class Runner:
         # Create the local vars dict if it does not exist
         if not hasattr(self, 'vars'):
             self.vars = {}
+        # Remember which variables were touched (used by parallel workers to send back only what changed)
+        if self.__dict__.get('touchedvars') is not None:
+            self.touchedvars.update(dictofvars.keys() if type(dictofvars) == type(dict()) else ['lastout'])
         # Update/add the values inside dictofvars (if it is a dictionary of variables)
         if type(dictofvars) == type(dict()):
             self.vars.update(dictofvars) # add new variables from dict and merge updated values for already existing variables
@@ -153,103 +192,365 @@ class Runner:
             # Save this output
             self.vars.update({"lastout": dictofvars})
 
+    ## Compute the key of the output of a module in the stages cache
+    # The key depends on the module's class, the config keys it reads, the input vars it declares as arguments of its method, and the texts it can fetch from the reader
+    # @param module Module object
+    # @param method Method to call in the module (as string)
+    # @param allvars Namespace or dict of vars from which the arguments of the method will be fetched
+    # @return string Hex digest
+    def stage_key(self, module, method, allvars):
+        inputs = get_kwargs(module, method, allvars)
+        if 'Vars' in inputs: # the module can read any var
+            inputs['Vars'] = sorted(allvars.iteritems())
+        inputs = sorted(inputs.iteritems())
+        parts = [module.__class__.__module__, module.__class__.__name__, method, module.get_config_values(), inputs]
+        if self.__dict__.get('reader', None):
+            parts.append(self.reader.fingerprint())
+        return DiskCache.hash(parts)
+
+    ## Call the method of one module, or load its output from the stages cache if it was already computed with the same inputs
+    # @param module Module object
+    # @param method Method to call in the module (as string)
+    # @param allvars Namespace or dict of vars: only the vars named in the arguments of the method are passed to it (and the whole namespace if it has a Vars argument)
+    # @param verbose Print more details about the executed routine
+    # @param cache Use the stages cache (if enabled)
+    # @return The output of the method
+    def call_module(self, module, method, allvars, verbose=False, cache=True):
+        profiler = self.__dict__.get('profiler', None)
+        if profiler is not None:
+            token = profiler.start()
+
+        fullfunc = getattr(module, method)
+        cached = False
+        # No cache, or this module does not want to be cached
+        if not cache or self.__dict__.get('cache', None) is None or not getattr(module, 'cacheable', True):
+            out = fullfunc(**get_kwargs(module, method, allvars))
+        else:
+            key = self.stage_key(module, method, allvars)
+            notfound = object()
+            out = self.cache.get(key, notfound)
+            if out is not notfound:
+                cached = True
+                if verbose: print("Routine: Loaded output of module %s from cache" % module.__class__.__name__)
+            else:
+                out = fullfunc(**get_kwargs(module, method, allvars))
+                self.cache.set(key, out)
+
+        if profiler is not None:
+            profiler.stop(token, module.__class__.__name__, method, out, cached=cached)
+        return out
+
     ## Generically call one object and its method (if obj is a list, it will call the method of each and every one of the modules in the list)
+    # The modules read the vars through a layered namespace (see namespace.Namespace): the optional arguments are a layer on top of the local vars dict, so nothing is copied whatever the number of vars.
     # @param obj Object or list of objects
     # @param method Method to call in the object(s) (as string)
-    # @param args Optional arguments to pass to the method (must be a dictionary, with they keys being the name of the variables)
-    # @param return_vars Return a value instead of updating the local vars dict
+    # @param args Optional arguments to pass to the method (must be a dictionary, with they keys being the name of the variables). They have precedence over the local vars.
+    # @param return_vars Return the vars instead of updating the local vars dict: the returned Namespace contains the args and the outputs of the modules on top of the local vars (which are left untouched)
     # @param verbose Print more details about the executed routine
-    # TODO: reduce the number of maintained dictionaries (there are 4: self.vars, allvars, dictofvars and args)
-    # TODO: fix return_vars, it does work, but sometimes there is a bleeding effect (mixing up local variables and arguments variables. The best would be to use local variables where needed, but use argument variables foremost, and keep tracking of argument variables that are changed)
     def generic_call(self, obj, method, args=None, return_vars=False, verbose=False):
-        # Create the local dict of vars
-        allvars = dict() # input dict of vars
-        if return_vars: dictofvars = dict() # output dict of vars (if return_vars is True)
-        # Append the optional arguments to pass to methods
-        if args is not None and type(args) == dict:
-                    allvars.update(args)
-                    if return_vars: dictofvars.update(args) # args and dictofvars must have ascendance over everything else when using return_vars
-        # If we have a list of modules to call, we call the method of each and every one of those modules
+        # Create the namespace of vars: a layer with the optional arguments (and the outputs if return_vars is True) on top of the local dict of vars
+        allvars = Namespace(self.vars, args if type(args) == dict else None)
+        # If we have a list of modules to call, we call the method of each and every one of those modules, else we have only one module to call
         if isinstance(obj, (dict, OrderedDict)):
-            # For every module in the list
-            for submodule in obj.itervalues():
-                # Print infos
-                if verbose:
-                    print("Routine: Calling module %s..." % submodule.__class__.__name__)
-                    sys.stdout.flush()
-                # Update the local dict of vars
-                allvars.update(self.vars)
-                if return_vars: allvars.update(dictofvars)
-                # Get the callable object's method
-                fullfunc = getattr(submodule, method)
-                # Call the specified function for the specified module
-                if not return_vars:
-                    # By default we store in the local dict
-                    self.updatevars(fullfunc(**allvars))
-                else:
-                    # Else we update a temporary dictofvars and we return it at the end
-                    dictofvars.update(fullfunc(**allvars))
-                # Force flusing the text into the terminal
-                sys.stdout.flush()
-            # Return the dictofvars at the end of the loop if the user wants to return the variables to the caller instead of storing them locally
-            if return_vars:
-                allvars.update(dictofvars) # return the input vars updated with the outputvars
-                return allvars
-
-        # Else if it is an object (thus only one module to call), we directly call its method
+            modules = obj.itervalues()
         else:
+            modules = [obj]
+        # For every module in the list
+        for submodule in modules:
             # Print infos
-            if verbose: print("Routine: Calling module %s..." % obj.__class__.__name__)
-            # Get the callable object's method
-            fullfunc = getattr(obj, method)
-            # Update the local dict of vars
-            allvars.update(self.vars)
-            if return_vars: allvars.update(dictofvars)
+            if verbose:
+                print("Routine: Calling module %s..." % submodule.__class__.__name__)
+                sys.stdout.flush()
             # Call the specified function for the specified module
             if not return_vars:
-                self.updatevars(fullfunc(**allvars))
+                # By default we store in the local dict (the next modules will see it through the namespace)
+                self.updatevars(self.call_module(submodule, method, allvars, verbose=verbose))
             else:
-                allvars.update(fullfunc(**allvars)) # return the input vars updated with the outputvars
-                return allvars
+                # Else we store in the namespace's layer and we return it at the end
+                out = self.call_module(submodule, method, allvars, cache=False)
+                if type(out) == type(dict()):
+                    allvars.update(out)
+                else:
+                    allvars['lastout'] = out
             # Force flusing the text into the terminal
             sys.stdout.flush()
+        # Return the namespace at the end of the loop if the user wants to return the variables to the caller instead of storing them locally
+        if return_vars:
+            return allvars
+
+    ## Resolve an item of a routine into the category of modules and the method to call
+    # @param mod Item of the routine, either a string (category of modules, the default publicmethod will be called) or a dict {"moduletype":"method"}
+    # @return tuple (module, func) or None if the format is not recognized
+    def resolve_mod(self, mod):
+        # If it's a dict (specifying the module type and the method to call, format: {"moduletype":"method"})
+        if isinstance(mod, dict):
+            # Unpacking the dict
+            module = mod.keys()[0]
+            func = mod.values()[0]
+        # Else if it's a string, thus there's only the module type, we will call the default public method
+        elif isinstance(mod, basestring):
+            module = mod # it's just a string, the name of the category of modules to call
+
+            # For the method it's a bit more tricky: we try to get the publicmethod, declared in the base class of each category of modules (and thus inherited by modules)
+            # Special case: we defined multiples modules to load in "classes" config for this category of modules, so we just get publicmethod from the first module in the dict
+            if isinstance (self.__dict__[module], (dict, OrderedDict)):
+                func = self.__dict__[module].itervalues().next().publicmethod
+            # Else it's a single module, we can get the publicmethod right away
+            else:
+                func = self.__dict__[module].publicmethod
+        # Else it's not a recognized format
+        else:
+            return None
+        return (module, func)
+
+    ## Call several categories of modules in parallel, each one in its own forked process, and merge back the returned vars in the order of the list
+    # The modules of the list must be independent (they all see the vars as they were before the list, and not the vars returned by the other modules of the list)
+    # @param modlist A list of items of a routine (same format as in execute())
+    # @param verbose Print more details about the executed routine
+    def parallel_call(self, modlist, verbose=False):
+        calls = [c for c in [self.resolve_mod(mod) for mod in modlist] if c is not None]
+
+        ## Call one category of modules and return only the vars it added or changed (the rest is already in the parent's memory), along with the profiler records
+        def call(c):
+            (module, func) = c
+            self.touchedvars = set()
+            records = None
+            try:
+                if self.__dict__.get('profiler', None) is not None:
+                    saved, self.profiler.records = self.profiler.records, list()
+                    try:
+                        self.generic_call(self.__dict__[module], func, verbose=verbose)
+                    finally:
+                        # Restore the previous records in case we were not forked (if there is nothing to parallelize)
+                        records, self.profiler.records = self.profiler.records, saved
+                else:
+                    self.generic_call(self.__dict__[module], func, verbose=verbose)
+                return (dict((key, self.vars.get(key)) for key in self.touchedvars), records)
+            finally:
+                self.touchedvars = None
+
+        if verbose:
+            print("Routine: Calling modules %s in parallel..." % ', '.join([module for (module, func) in calls]))
+            sys.stdout.flush()
+        results = parallel.fork_map(call, calls, workers=self.config.get('parallel_workers', None))
+        # Merge back the vars in a fixed order (the order of the list), so that the result is deterministic
+        for (dictofvars, records) in results:
+            self.updatevars(dictofvars)
+            if records:
+                self.profiler.records.extend(records)
+
+    ## Build the dependency graph of a routine, from the vars read by each module (the named arguments of its method), the vars it writes (outputvars, plus the vars it reads if it changes them according to its dataflags) and its 'after' constraint
+    # A module depends on the last module before it that wrote a var it reads, and on the modules before it that read a var it writes (so that they don't see its output). Two modules writing the same var without reading it don't depend on each other: the output of the last one in the routine wins.
+    # @param executelist A list containing the sequence of modules to launch (sublists are flattened: the graph finds by itself what can be run concurrently)
+    # @return tuple (nodes, deps) where nodes is the list of the modules to call in the order of the routine, as tuples (category, submodname, submodule, method), and deps is a dict {node index: set of indexes of the nodes it depends on}
+    def plan_workflow(self, executelist):
+        # List all the submodules to call, in the order of the routine
+        nodes = list()
+        for item in executelist:
+            for mod in (item if isinstance(item, list) else [item]):
+                c = self.resolve_mod(mod)
+                # Not a recognized format, we pass
+                if c is None:
+                    continue
+                (category, func) = c
+                module = self.__dict__[category]
+                if isinstance(module, (dict, OrderedDict)):
+                    submods = module
+                else: # only one submodule, we convert it do a dict
+                    submods = {module.__class__.__name__.lower(): module}
+                for submodname, submod in submods.iteritems():
+                    nodes.append((category, submodname, submod, func))
+
+        deps = dict((i, set()) for i in xrange(len(nodes)))
+        lastwriter = dict() # var -> index of the last node that wrote it
+        readers = dict() # var -> indexes of the nodes that read it since it was last written
+        barrier = None # last node with unknown outputs
+        for i, (category, submodname, submod, func) in enumerate(nodes):
+            outputs = getattr(submod, 'outputvars', None)
+            # Unknown outputs or inputs (the module asks for the whole namespace of vars): this node depends on all the nodes before it, and all the nodes after it depend on it
+            if outputs is None or get_argnames(submod, func)[1]:
+                deps[i].update(xrange(i))
+                barrier = i
+                continue
+            if barrier is not None:
+                deps[i].add(barrier)
+            inputs = set(get_argnames(submod, func)[0])
+            if getattr(submod, 'dataflags', None) and submod.dataflags.get('change'):
+                inputs.update(outputs)
+            # Read after write
+            for var in inputs:
+                if var in lastwriter:
+                    deps[i].add(lastwriter[var])
+                readers.setdefault(var, set()).add(i)
+            # Write after read
+            for var in outputs:
+                deps[i].update(readers.get(var, set()) - set([i]))
+                lastwriter[var] = i
+                readers[var] = set()
+
+        # 'after' constraints
+        for i, (category, submodname, submod, func) in enumerate(nodes):
+            after = (getattr(submod, 'constraints', None) or {}).get('after')
+            if after is None:
+                continue
+            for j, (category2, submodname2, submod2, func2) in enumerate(nodes):
+                # A submodule can only be constrained to be after the submodules of its own category that are before it in the routine
+                if j == i or (category2 == category and j > i):
+                    continue
+                if after in (category2, submodname2):
+                    deps[i].add(j)
+
+        return (nodes, deps)
+
+    ## Find a cycle in a dependency graph
+    # @param deps Dict {node index: set of indexes of the nodes it depends on}
+    # @return list Indexes of the nodes that are part of a cycle or depend on one (empty if the graph is acyclic)
+    @staticmethod
+    def find_cycle(deps):
+        remaining = dict((i, set(d)) for (i, d) in deps.iteritems())
+        ready = [i for (i, d) in remaining.iteritems() if not d]
+        while ready:
+            i = ready.pop()
+            del remaining[i]
+            for (j, d) in remaining.iteritems():
+                if i in d:
+                    d.discard(i)
+                    if not d:
+                        ready.append(j)
+        return sorted(remaining.iterkeys())
+
+    ## Execute a routine as a dependency graph: modules that don't depend on each other are run concurrently in forked processes (see plan_workflow())
+    # The vars are merged back as soon as a module is done, so that the modules depending on it are forked with its output. The result is the same as the serial execution of the routine.
+    # @param executelist A list containing the sequence of modules to launch
+    # @param verbose Print more details about the executed routine
+    def execute_dag(self, executelist, verbose=False):
+        (nodes, deps) = self.plan_workflow(executelist)
+
+        # Reject cycles before running anything
+        cycle = Runner.find_cycle(deps)
+        if cycle:
+            print("FATAL ERROR: the workflow has circular dependencies between the modules %s (check the vars they use and their constraints)." % ', '.join([nodes[i][1] for i in cycle]))
+            return False
+
+        # Resume from the last checkpoint (the stages are the modules here)
+        signature = self.workflow_signature(executelist)
+        done = self.load_checkpoint(signature)
+
+        if verbose:
+            print("Routine: Scheduling modules by dependencies:")
+            for i, (category, submodname, submod, func) in enumerate(nodes):
+                print("  %s.%s after %s" % (submodname, func, ', '.join([nodes[j][1] for j in sorted(deps[i])]) or 'nothing'))
+            sys.stdout.flush()
+
+        owner = dict() # var -> index of the node whose output is currently stored in vars (the last one in the routine wins)
+
+        ## Call one module and return its output, along with the profiler records
+        def call(i):
+            (category, submodname, submod, func) = nodes[i]
+            if verbose:
+                print("Routine: Calling module %s..." % submod.__class__.__name__)
+                sys.stdout.flush()
+            if self.__dict__.get('profiler', None) is None:
+                return (self.call_module(submod, func, self.vars, verbose=verbose), None)
+            saved, self.profiler.records = self.profiler.records, list()
+            try:
+                out = self.call_module(submod, func, self.vars, verbose=verbose)
+            finally:
+                # Restore the previous records in case we were not forked (if there is nothing to parallelize)
+                records, self.profiler.records = self.profiler.records, saved
+            return (out, records)
+
+        ## Merge back the output of a module into the vars
+        def merge(i, result):
+            (out, records) = result
+            if type(out) != type(dict()):
+                out = {'lastout': out}
+            for (key, value) in out.iteritems():
+                if owner.get(key, -1) <= i:
+                    owner[key] = i
+                    self.updatevars({key: value})
+            if records:
+                self.profiler.records.extend(records)
+            done.add(i)
+            if self.checkpoint is not None and len(done) < len(nodes):
+                self.checkpoint.save(signature, done, self.vars)
+            sys.stdout.flush()
+
+        parallel.fork_dag(call, range(len(nodes)), deps, workers=self.config.get('parallel_workers', None), callback=merge, done=set(done))
+        return True
+
+    ## Compute the signature of a routine: a checkpoint is only resumed by a routine with the same modules, config and texts
+    # @param executelist A list containing the sequence of modules to launch
+    # @param texts Include the texts in the signature (else only how they are read and preprocessed), and how the routine is run (mode, learning routine and scheduler)
+    # @return string Hex digest
+    def workflow_signature(self, executelist, texts=True):
+        parts = [executelist]
+        if texts:
+            parts.extend([self.vars.get('Mode'), bool(self.config.get('learn_incremental', False)), bool(self.config.get('learn_streaming', False)), self.config.get('workflow_scheduler', 'list')])
+        for item in executelist:
+            for mod in (item if isinstance(item, list) else [item]):
+                c = self.resolve_mod(mod)
+                if c is None:
+                    continue
+                module = self.__dict__[c[0]]
+                for submod in (module.values() if isinstance(module, (dict, OrderedDict)) else [module]):
+                    parts.append((submod.__class__.__name__, submod.get_config_values()))
+        if self.__dict__.get('reader', None):
+            parts.append(self.reader.fingerprint() if texts else self.reader.get_settings())
+        return DiskCache.hash(parts)
+
+    ## Load the last checkpoint if we were asked to resume (config resume), and restore its vars
+    # @param signature Signature of the current routine (see workflow_signature())
+    # @return set Indexes of the stages already done (empty if we start from the beginning)
+    def load_checkpoint(self, signature):
+        if self.checkpoint is None or not self.config.get('resume', False):
+            return set()
+        state = self.checkpoint.load(signature)
+        if state is None:
+            return set()
+        (done, dictofvars) = state
+        self.updatevars(dictofvars)
+        print("Resuming from the checkpoint %s: %s stage(s) already done." % (self.checkpoint.path, len(done)))
+        return done
 
     ## Execute a routine: call any module(s) given a list of dicts containing {"submodule name": "method of the class to call"}
     # @param executelist A list containing the sequence of modules to launch (Note: the order of the contained elements matters!)
     # @param verbose Print more details about the executed routine
-    def execute(self, executelist, verbose=False):
+    # @param check Check the constraints of the modules first
+    def execute(self, executelist, verbose=False, check=True):
         # Checking constraints first
-        if not self.check_constraints():
+        if check and not self.check_constraints():
             print("FATAL ERROR while checking constraints. Please check your configuration. Exiting.")
             return False
 
+        # Dependency graph scheduler: run independent modules concurrently
+        if self.config.get('workflow_scheduler', 'list') == 'dag':
+            return self.execute_dag(executelist, verbose=verbose)
+
+        profiler = self.__dict__.get('profiler', None)
+
+        # Resume from the last checkpoint
+        signature = self.workflow_signature(executelist)
+        done = self.load_checkpoint(signature)
+
         # Loop through all modules in run_learn list
-        for mod in executelist:
+        for i, mod in enumerate(executelist):
+            # Stage already done before the checkpoint
+            if i in done:
+                continue
+            if profiler is not None:
+                token = profiler.start()
             # Catch exceptions: if a module fails, we continue onto the next one - TODO: try to set this option ("robust") in a config variable: for dev we want exceptions, in production maybe not (just a warning and then pass).
             #try:
             # Special case: this is a sublist, we run all the modules in the list in parallel
             if type(mod) == type(list()):
-                self.generic_call(mod, verbose=verbose) # TODO: launch each submodule in parallel (using subprocess or threading, but be careful: Python's threads aren't efficient so this is not useful at all, and subprocess creates a new object, so how to communicate the computed/returned variables efficiently in memory?)
+                self.parallel_call(mod, verbose=verbose)
             else:
-                # If it's a dict (specifying the module type and the method to call, format: {"moduletype":"method"})
-                if isinstance(mod, dict):
-                    # Unpacking the dict
-                    module = mod.keys()[0]
-                    func = mod.values()[0]
-                # Else if it's a string, thus there's only the module type, we will call the default public method
-                elif isinstance(mod, basestring):
-                    module = mod # it's just a string, the name of the category of modules to call
-
-                    # For the method it's a bit more tricky: we try to get the publicmethod, declared in the base class of each category of modules (and thus inherited by modules)
-                    # Special case: we defined multiples modules to load in "classes" config for this category of modules, so we just get publicmethod from the first module in the dict
-                    if isinstance (self.__dict__[module], (dict, OrderedDict)):
-                        func = self.__dict__[module].itervalues().next().publicmethod
-                    # Else it's a single module, we can get the publicmethod right away
-                    else:
-                        func = self.__dict__[module].publicmethod
-                # Else it's not a recognized format, we pass
-                else:
+                c = self.resolve_mod(mod)
+                # Not a recognized format, we pass
+                if c is None:
                     continue
+                (module, func) = c
 
                 # Call the module's method
                 self.generic_call(self.__dict__[module], func, verbose=verbose)
@@ -257,11 +558,32 @@ class Runner:
             #except Exception, e:
                 #print "Exception when executing the routine: %s" % str(e)
 
+            # Record the whole stage
+            if profiler is not None:
+                profiler.stop(token, 'workflow', mod if isinstance(mod, basestring) else json.dumps(mod), stage=True)
+
+            # Save a checkpoint of the vars (asynchronously), except after the last stage
+            done.add(i)
+            if self.checkpoint is not None and len(done) < len(executelist):
+                self.checkpoint.save(signature, done, self.vars)
+
             # Force flusing the text into the terminal
             sys.stdout.flush()
 
         return True
 
+    ## Print the stages profile and save it in a json file next to the resultsfile (only if profile_stages is enabled)
+    def save_profile(self):
+        if self.__dict__.get('profiler', None) is None:
+            return
+        self.profiler.print_summary()
+        if self.config.get('resultsfile', None):
+            profilefile = '%s_profile_%s.json' % (os.path.splitext(self.config.get('resultsfile'))[0], self.vars.get('Mode', 'Learning').lower())
+            if self.profiler.save(profilefile):
+                print('Stages profile saved in: %s' % profilefile)
+        # Start a new profile for the next run
+        self.profiler = StageProfiler(memory=self.profiler.memory)
+
     ## Write down the parameters into a file
     # Format of the file: json structure consisting of a dict where the keys are the names of the vars, and the values are strings encoding the data in csv format
     # TODO: replace by pandas.to_json() when the feature will be put back in the main branch?
@@ -439,41 +761,93 @@ class Runner:
 
         prevmod = list() # list of the past modules
         # Iterate over all modules categories
-        for mod in routine:
-            # mod is an item of the routine, and it can either be a string (module category name), or a dict (modname + method)
-            if isinstance(mod, (dict, OrderedDict)): # in this case, we need to unpack the name
-                modname = mod.iterkeys().next() # unpack the key
-            else: # else it's just a string, it's directly the name
-                modname = mod
-            # Get the module object
-            module = self.__dict__[modname]
-            # Little trick to do a for each loop in any case (in case we have only one submodule for this category of modules, or if we have a dict of submodules)
-            if (isinstance(module, (dict, OrderedDict))):
-                submods = module
-            else: # only one submodule, we convert it do a dict
-                classname = module.__class__.__name__.lower()
-                submods = {classname: module}
-            # For each submodule
-            for submodname, submod in submods.iteritems():
-                # If some constraints are set for this submodule
-                if getattr(submod, 'constraints', None) is not None:
-                    #-- Checking "after" constraint
-                    if submod.constraints.get('after') is not None:
-                        # If this submodule must be launched after another module, but this other module was not set before in the workflow, then warning
-                        if submod.constraints['after'] not in prevmod:
-                            constraint_error(submodname, "%s:%s" % ('after', submod.constraints['after']))
-
-                # Add current submodule name into the list of past modules
-                prevmod.append(submodname)
-                # Flush output
-                sys.stdout.flush()
-            # Add current module category into the list of past modules
-            prevmod.append(modname)
+        for item in routine:
+            # A sublist is run in parallel, so its modules can only depend on the modules before the sublist, not on each other
+            if isinstance(item, list):
+                sublist = item
+            else:
+                sublist = [item]
+            curmod = list() # modules of the current item, added to the past modules only after the whole item was checked
+            for mod in sublist:
+                # mod is an item of the routine, and it can either be a string (module category name), or a dict (modname + method)
+                if isinstance(mod, (dict, OrderedDict)): # in this case, we need to unpack the name
+                    modname = mod.iterkeys().next() # unpack the key
+                else: # else it's just a string, it's directly the name
+                    modname = mod
+                # Get the module object
+                module = self.__dict__[modname]
+                # Little trick to do a for each loop in any case (in case we have only one submodule for this category of modules, or if we have a dict of submodules)
+                if (isinstance(module, (dict, OrderedDict))):
+                    submods = module
+                else: # only one submodule, we convert it do a dict
+                    classname = module.__class__.__name__.lower()
+                    submods = {classname: module}
+                catmod = list() # submodules of the current category (they are called serially, even inside a sublist)
+                # For each submodule
+                for submodname, submod in submods.iteritems():
+                    # If some constraints are set for this submodule
+                    if getattr(submod, 'constraints', None) is not None:
+                        #-- Checking "after" constraint
+                        if submod.constraints.get('after') is not None:
+                            # If this submodule must be launched after another module, but this other module was not set before in the workflow, then warning
+                            if submod.constraints['after'] not in prevmod and submod.constraints['after'] not in catmod:
+                                constraint_error(submodname, "%s:%s" % ('after', submod.constraints['after']))
+
+                    # Add current submodule name into the list of past modules
+                    catmod.append(submodname)
+                    # Flush output
+                    sys.stdout.flush()
+                # Add current module category into the list of past modules
+                curmod.extend(catmod)
+                curmod.append(modname)
+            prevmod.extend(curmod)
 
 
         return True
 
 
+    ## Compile the corpus store: extract the tokens streams of the texts of the learning and detection textconfigs once, and store them as ids in a binary store (see CorpusStore), so that the next runs load the features of these texts from the store instead of reading, preprocessing and extracting them again
+    # The texts already compiled (and unchanged) are skipped, so this can be run again after adding texts.
+    # @return bool True if the store was compiled
+    def compile_corpus(self):
+        path = self.config.get('corpus_store')
+        if not path:
+            print("Error: no corpus_store directory is set in the config, can't compile the corpus")
+            return False
+        extractors = self.featuresextractor.values() if isinstance(self.featuresextractor, dict) else [self.featuresextractor]
+
+        store = CorpusStore(path, write=True)
+        self.corpusstore = None # do not load the features from the store while compiling it
+        added = skipped = 0
+        try:
+            for (mode, textconfig) in [('Learning', 'textconfig'), ('Detection', 'textconfig_detection')]:
+                if not self.config.get(textconfig) or not os.path.isfile(self.config.get(textconfig)):
+                    continue
+                self.updatevars({'Mode': mode})
+                self.config.update({'Mode': mode})
+                self.reader.reloadconfig()
+                print("Compiling the texts of %s..." % self.config.get(textconfig)); sys.stdout.flush()
+                for idx in self.reader.get_indexes():
+                    text = None
+                    for extractor in extractors:
+                        key = extractor.get_store_key(idx)
+                        if key in store:
+                            skipped += 1
+                            continue
+                        if text is None:
+                            text = self.reader.get_text(idx)
+                        store.add(key, extractor.extract_streams(text, idx))
+                        added += 1
+                    del text
+                # Save the index after each textconfig, so that an interruption does not lose everything
+                store.save()
+        finally:
+            store.close()
+
+        self.corpusstore = CorpusStore(path)
+        print("Corpus store %s compiled: %s texts added, %s already compiled, %s tokens in the vocabulary." % (path, added, skipped, len(self.corpusstore.vocab)))
+        return True
+
     ## Learning routine: Train the system to learn how to detect cheating
     def learn(self, executelist=None):
         # Specify the mode
@@ -483,6 +857,9 @@ class Runner:
         # Reload the texts config
         if self.__dict__.get('reader', None):
             self.reader.reloadconfig() # make sure the textreader updates the list of texts it must load (depending on Mode)
+            # Skip the duplicated texts (and report the near-duplicates) before extracting anything from them
+            if self.config.get('reader_dedup', False):
+                self.reader.dedup()
 
         # We can pass an execution list either as an argument (used for recursion) or in the configuration
         if not executelist:
@@ -505,35 +882,198 @@ class Runner:
         # Initialization, do various stuff
         print("Initializing, this can take a few moments, please wait..."); sys.stdout.flush()
 
-        # Execute all modules of the routine (either of config['workflow_learn'] or the standard routine)
-        if not self.execute(executelist, verbose=True): # We generally prefer to print all infos when learning
-            return False
-
-        print('All done!')
+        # Checkpoint the vars after each stage, to be able to resume an interrupted learning
+        if self.config.get('checkpoint', False) or self.config.get('resume', False):
+            self.checkpoint = Checkpoint(self.config.get('checkpoint_file', None) or '%s.checkpoint' % (self.config.get('parametersfile', None) or 'parameters'))
 
-        # End of learning, we save the parameters if a parametersfile was specified
-        if self.config.get('parametersfile', None):
-            Runner.save_vars(self.config.get('parametersfile'), self.vars, ['X', 'Y', 'X_raw', 'Weights', 'Mode']) # save all vars but X and Y (which may be VERY big and aren't parameters anyway)
-            print('Learned parameters saved in: %s' % self.config.get('parametersfile'))
+        try:
+            # Execute all modules of the routine (either of config['workflow_learn'] or the standard routine)
+            if self.config.get('learn_incremental', False):
+                # Incremental mode: only the texts that were not learned yet are processed and added to the previously learned raw counts
+                if not self.learn_incremental(executelist, verbose=True):
+                    return False
+            elif self.config.get('learn_streaming', False):
+                # Streaming mode: texts go one at a time through the modules before the merger
+                if not self.learn_streaming(executelist, verbose=True):
+                    return False
+            elif not self.execute(executelist, verbose=True): # We generally prefer to print all infos when learning
+                return False
+
+            print('All done!')
+            self.save_profile()
+
+            # End of learning, we save the parameters if a parametersfile was specified
+            if self.config.get('parametersfile', None):
+                Runner.save_vars(self.config.get('parametersfile'), self.vars, ['X', 'Y', 'X_raw', 'Weights', 'Mode']) # save all vars but X and Y (which may be VERY big and aren't parameters anyway)
+                print('Learned parameters saved in: %s' % self.config.get('parametersfile'))
+
+            # The learning is complete, the checkpoint is not needed anymore
+            if self.checkpoint is not None:
+                self.checkpoint.remove()
+        finally:
+            # Wait for the checkpoint being written and forget it, even if the learning failed (its file is kept to resume later), so that the next routines of this process (eg: a detection) neither save into it nor resume from it
+            if self.checkpoint is not None:
+                self.checkpoint.wait()
+                self.checkpoint = None
 
         return True
 
-    ## Detection routine: identify the labels for the unlabeled texts
-    def run(self, executelist=None):
-        # Specify the mode
-        self.updatevars({'Mode': 'Detection'})
-        self.config.update({'Mode': 'Detection'})
-        if self.__dict__.get('reader', None):
-            self.reader.reloadconfig() # make sure the textreader updates the list of texts it must load (depending on Mode)
+    ## Find the merger in a routine (the point where the texts are merged), for the streaming and incremental learning routines
+    # @param executelist A list containing the sequence of modules to launch
+    # @return int Position of the merger in executelist, or None if there is not exactly one merger module with a fold() method
+    def find_merger(self, executelist):
+        pos = None
+        for i, mod in enumerate(executelist):
+            if not isinstance(mod, list) and self.resolve_mod(mod) is not None and self.resolve_mod(mod)[0] == 'merger':
+                pos = i
+                break
+        merger = self.__dict__.get('merger', None)
+        if pos is None or merger is None or isinstance(merger, (dict, OrderedDict)) or not hasattr(merger, 'fold') or not self.__dict__.get('reader', None):
+            return None
+        return pos
+
+    ## Stream texts one at a time through the modules before the merger, and fold their Patterns tables into the merged Patterns tables
+    # @param executelist The modules to call for each text (the part of the routine before the merger)
+    # @param idxs Indexes of the texts to process
+    # @param P2 The merged Patterns tables per attribute (will be updated in place)
+    # @param verbose Print more details about the executed routine
+    # @return dict P2
+    def fold_texts(self, executelist, idxs, P2, verbose=False):
+        # Modules to call for each text (sublists are called serially here, since we are processing one text at a time)
+        pre = list()
+        for mod in executelist:
+            if isinstance(mod, list):
+                pre.extend([self.resolve_mod(m) for m in mod])
+            else:
+                pre.append(self.resolve_mod(mod))
+        pre = [c for c in pre if c is not None]
 
-        # Load the parameters if a file is specified
-        if self.config.get('parametersfile', None):
-            self.updatevars(Runner.load_vars(self.config.config['parametersfile'], prefixkey='L_'))
+        idxs = list(idxs)
+        if verbose:
+            print("Routine: Streaming %s texts through modules %s and then merging..." % (len(idxs), ', '.join([module for (module, func) in pre])))
+            sys.stdout.flush()
 
-        # We can pass an execution list either as an argument (used for recursion) or in the configuration
-        if not executelist:
-            executelist = self.config.get('workflow', None)
+        try:
+            for n, idx in enumerate(idxs):
+                if self.config.get('debug'):
+                    print("Streaming text %s/%s..." % (n+1, len(idxs)))
+                # Make the reader return only this text
+                self.reader.select([idx])
+                for (module, func) in pre:
+                    self.generic_call(self.__dict__[module], func)
+                # Fold the Patterns table of this text (which is the only one, at index 0) into the merged tables
+                self.merger.fold(P2, idx, self.vars['Patterns'][0])
+                # Discard the features and patterns of this text
+                for key in ['X', 'Patterns']:
+                    if key in self.vars: del self.vars[key]
+        finally:
+            self.reader.select(None)
+        return P2
+
+    ## Streaming learning routine: each text goes through all the modules before the merger, then is folded into the merged Patterns tables and discarded right away
+    # This bounds the memory to the biggest text plus the merged Patterns tables, instead of keeping the features and patterns of all texts at once.
+    # The modules after the merger are then executed normally.
+    # @param executelist A list containing the sequence of modules to launch (must contain the merger)
+    # @param verbose Print more details about the executed routine
+    def learn_streaming(self, executelist, verbose=False):
+        pos = self.find_merger(executelist)
+        if pos is None:
+            print("WARNING: streaming learning needs exactly one merger module in the workflow with a fold() method. Falling back to the standard learning routine.")
+            return self.execute(executelist, verbose=verbose)
 
+        # Checking constraints first
+        if not self.check_constraints():
+            print("FATAL ERROR while checking constraints. Please check your configuration. Exiting.")
+            return False
+
+        P2 = self.fold_texts(executelist[:pos], xrange(len(self.reader)), dict(), verbose=verbose)
+        self.updatevars({'Patterns': P2})
+
+        # Execute the rest of the routine after the merger
+        return self.execute(executelist[pos+1:], verbose=verbose)
+
+    ## Incremental learning routine: add the texts that were not learned yet to the parameters learned previously
+    # The merged raw counts (Patterns_raw, before the postprocessors) and the list of the learned texts with their content hash (Texts_seen) are stored in the parametersfile. The new texts are streamed through the modules before the merger and folded into the raw counts, then the modules after the merger (eg: TF-IDF, filters) are recomputed from the raw counts.
+    # If a learned text was changed or removed, or if the config of the modules before the merger changed, all the texts are learned again.
+    # @param executelist A list containing the sequence of modules to launch (must contain the merger)
+    # @param verbose Print more details about the executed routine
+    def learn_incremental(self, executelist, verbose=False):
+        pos = self.find_merger(executelist)
+        if pos is None:
+            print("WARNING: incremental learning needs exactly one merger module in the workflow with a fold() method. Falling back to the standard learning routine.")
+            return self.execute(executelist, verbose=verbose)
+
+        # Checking constraints first
+        if not self.check_constraints():
+            print("FATAL ERROR while checking constraints. Please check your configuration. Exiting.")
+            return False
+
+        # Signature of everything the raw counts depend on, except the texts
+        signature = self.workflow_signature(executelist[:pos+1], texts=False)
+
+        # Load the previously learned raw counts and texts
+        P2 = dict()
+        seen = None
+        parametersfile = self.config.get('parametersfile', None)
+        if parametersfile and os.path.exists(parametersfile):
+            previous = Runner.load_vars(parametersfile)
+            if previous.get('Patterns_raw') is not None and previous.get('Texts_seen') is not None:
+                P2 = previous['Patterns_raw']
+                seen = dict((str(path), row) for (path, row) in previous['Texts_seen'].iterrows())
+            else:
+                print("No raw counts found in the parameters file %s, learning from all the texts." % parametersfile)
+
+        # Find the new texts, and check that the learned texts did not change
+        rows = list()
+        new = list()
+        relearn = False
+        for idx in xrange(len(self.reader)):
+            path = self.reader.get_params(idx)['file']
+            (size, mtime) = self.reader.get_stat(idx)
+            row = seen.get(path) if seen is not None else None
+            # Reuse the hash if the file was not modified since it was learned
+            if row is not None and row['size'] == size and row['mtime'] == mtime:
+                md5 = str(row['md5'])
+            else:
+                md5 = self.reader.get_hash(idx)
+            if row is None:
+                new.append(idx)
+            elif md5 != str(row['md5']) or str(row['signature']) != signature:
+                relearn = True
+            rows.append((path, md5, size, mtime, signature))
+        if seen is not None and set(seen.iterkeys()) - set([row[0] for row in rows]):
+            relearn = True
+        if relearn:
+            print("WARNING: some learned texts were changed or removed, or the config of the modules changed: learning from all the texts again.")
+            P2 = dict()
+            new = range(len(self.reader))
+        print("Incremental learning: %s new text(s) out of %s." % (len(new), len(self.reader)))
+
+        # Fold the new texts into the raw counts
+        P2 = self.fold_texts(executelist[:pos], new, P2, verbose=verbose)
+        self.updatevars({'Patterns_raw': dict((attr, P.copy()) for (attr, P) in P2.iteritems()), # copy, because the postprocessors may change the tables in place
+                         'Texts_seen': pd.DataFrame(rows, columns=['file', 'md5', 'size', 'mtime', 'signature']).set_index('file'),
+                         'Patterns': P2})
+
+        # Recompute the rest of the routine after the merger from the raw counts
+        return self.execute(executelist[pos+1:], verbose=verbose)
+
+    ## Load the learned parameters from the parametersfile into the vars (prefixed by L_), unless they were already loaded from the same file and it did not change since
+    # @return bool True if the parameters are loaded
+    def load_parameters(self):
+        parametersfile = self.config.get('parametersfile', None)
+        if not parametersfile:
+            return False
+        st = os.stat(parametersfile)
+        key = (os.path.abspath(parametersfile), st.st_size, st.st_mtime)
+        if self.__dict__.get('parameterskey', None) != key:
+            self.updatevars(Runner.load_vars(parametersfile, prefixkey='L_'))
+            self.parameterskey = key
+        return True
+
+    ## Return the detection routine: either config['workflow'] or the standard detection routine
+    def get_detection_routine(self):
+        executelist = self.config.get('workflow', None)
         # Standard detection routine
         # If no routine is given, then we execute the standard detection routine
         if not executelist:
@@ -546,11 +1086,29 @@ class Runner:
             if self.__dict__.get('postprocessing', None):
                 executelist.append({"postprocessing": "process"})
             executelist.append({"detector": "detect"})
+        return executelist
+
+    ## Detection routine: identify the labels for the unlabeled texts
+    def run(self, executelist=None):
+        # Specify the mode
+        self.updatevars({'Mode': 'Detection'})
+        self.config.update({'Mode': 'Detection'})
+        if self.__dict__.get('reader', None):
+            self.reader.reloadconfig() # make sure the textreader updates the list of texts it must load (depending on Mode)
+
+        # Load the parameters if a file is specified
+        self.load_parameters()
+
+        # We can pass an execution list either as an argument (used for recursion) or in the configuration
+        if not executelist:
+            executelist = self.get_detection_routine()
 
         # Execute all modules of the routine (either of config['workflow'] or the standard routine)
         if not self.execute(executelist, verbose=True): # We generally prefer to print all infos
             return False
 
+        self.save_profile()
+
         # End of identification, we save the results in a file if specified
         if self.config.get('resultsfile', None):
             Runner.save_vars(self.config.get('resultsfile'), {'Result': self.vars.get('Result'), 'Result_details': self.vars.get('Result_details')}) # save the Result and Result_details variable
@@ -558,6 +1116,101 @@ class Runner:
 
         return True
 
+    ## Batch detection routine: identify the labels for several sets of unlabeled texts (one textconfig_detection per set) in one invocation
+    # The learned parameters are loaded only once, and the sets are processed in forked processes (which share the parameters in memory by copy-on-write), at most batch_workers at a time.
+    # The results of each set are saved next to its textconfig, in a file named after it and the resultsfile (eg: cases/case1.json -> cases/case1_results.txt).
+    # @param textconfigs List of paths or glob patterns of textconfig_detection files
+    # @param executelist Routine to execute (by default, the detection routine)
+    # @return bool True if all the sets were processed successfully
+    def run_batch(self, textconfigs, executelist=None):
+        # Expand the glob patterns
+        if isinstance(textconfigs, basestring):
+            textconfigs = [textconfigs]
+        inputs = list()
+        for pattern in textconfigs:
+            paths = sorted(glob.glob(pattern))
+            if not paths:
+                print("WARNING: no textconfig found matching %s" % pattern)
+            inputs.extend([path for path in paths if path not in inputs])
+        if not inputs:
+            print("FATAL ERROR: no textconfig to process in batch.")
+            return False
+
+        # Specify the mode
+        self.updatevars({'Mode': 'Detection'})
+        self.config.update({'Mode': 'Detection'})
+
+        # Load the parameters only once, before forking
+        self.load_parameters()
+        if not executelist:
+            executelist = self.get_detection_routine()
+        if not self.check_constraints():
+            print("FATAL ERROR while checking constraints. Please check your configuration. Exiting.")
+            return False
+
+        (resultsstem, resultsext) = os.path.splitext(os.path.basename(self.config.get('resultsfile', None) or 'results.txt'))
+
+        ## Detect one set of texts and save its results
+        def detect(textconfig):
+            resultsfile = '%s_%s%s' % (os.path.splitext(textconfig)[0], resultsstem, resultsext)
+            try:
+                self.config.update({'textconfig_detection': textconfig})
+                self.reader.reloadconfig()
+                print("Batch: identifying the texts of %s..." % textconfig)
+                if not self.execute(executelist, check=False):
+                    return (textconfig, None, 'execution failed')
+                Runner.save_vars(resultsfile, {'Result': self.vars.get('Result'), 'Result_details': self.vars.get('Result_details')})
+                return (textconfig, resultsfile, None)
+            except Exception:
+                return (textconfig, None, traceback.format_exc())
+
+        results = parallel.fork_map(detect, inputs, workers=self.config.get('batch_workers', None) or self.config.get('parallel_workers', None))
+
+        # Summary
+        success = True
+        for (textconfig, resultsfile, error) in results:
+            if error is None:
+                print('Identification results of %s saved in: %s' % (textconfig, resultsfile))
+            else:
+                print('ERROR: identification of %s failed: %s' % (textconfig, error))
+                success = False
+        self.save_profile()
+        return success
+
+    ## Hot detection API (for script mode): identify the labels of texts given as strings, without touching the disk
+    # The learned parameters are loaded only at the first call (or if the parametersfile changed), and the modules keep their state between calls (eg: TreeTagger stays launched). The stages cache is not used.
+    # Eg: runner = authordetector.main.main(['--script', '-p', 'parameters.txt']); runner.detect_texts([u'Some text', u'Another text'])
+    # @param texts List of texts (strings)
+    # @param executelist Routine to execute (by default, the detection routine)
+    # @return dict A dict containing Result and Result_details (the texts are indexed by their position in texts)
+    def detect_texts(self, texts, executelist=None):
+        # Specify the mode
+        if self.vars.get('Mode') != 'Detection':
+            self.updatevars({'Mode': 'Detection'})
+            self.config.update({'Mode': 'Detection'})
+
+        self.load_parameters()
+        if not executelist:
+            executelist = self.get_detection_routine()
+
+        # Check the constraints only once
+        if not self.__dict__.get('constraints_checked', False):
+            if not self.check_constraints():
+                return None
+            self.constraints_checked = True
+
+        # Give the texts to the reader, and disable the cache (hashing the learned parameters at each call would cost more than the detection itself). The texts in memory are not stored in the preprocessed texts cache either, so nothing is written on the disk.
+        self.reader.set_texts(texts)
+        cache = self.cache
+        self.cache = None
+        try:
+            if not self.execute(executelist, check=False):
+                return None
+        finally:
+            self.cache = cache
+            self.reader.set_texts(None)
+        return {'Result': self.vars.get('Result'), 'Result_details': self.vars.get('Result_details')}
+
 if __name__ == '__main__':
     runner = Runner()
     runner.init()
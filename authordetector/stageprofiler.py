@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package stageprofiler
+#
+# Record the time and memory used by each module call, to find which stage of the workflow is slow or memory hungry
+
+from auxlib import *
+from authordetector.lib.debug.pympler import asizeof
+from collections import OrderedDict
+import os, sys
+import threading
+import time
+
+resource = import_module('resource') # not available on Windows, then the peak memory will not be recorded
+
+json = import_module('ujson')
+if json is None:
+    json = import_module('json')
+    if json is None:
+        raise RuntimeError('Unable to find a json implementation')
+
+## StageProfiler
+#
+# Record for every module call: wall time, CPU time, increase of the peak resident memory (RSS) and, if asked, approximate size of each var returned by the module
+class StageProfiler(object):
+
+    ## @var records
+    # List of the records (one dict per module call)
+
+    ## @var memory
+    # Measure the size of the vars returned by each module (this walks through all their objects, which can take longer than the module itself on big outputs)
+
+    ## Constructor
+    # @param memory Measure the size of the vars returned by each module (else only the increase of the peak RSS is recorded)
+    def __init__(self, memory=False, *args, **kwargs):
+        self.records = list()
+        self.memory = memory
+        self.local = threading.local() # records of the calls made by the function running in capture() in each thread
+        return object.__init__(self)
+
+    ## Return the peak resident memory of the process in bytes (None if not available)
+    @staticmethod
+    def get_maxrss():
+        if resource is None:
+            return None
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin': # bytes on MacOSX, kilobytes on Linux
+            return maxrss
+        return maxrss * 1024
+
+    ## Start measuring a call
+    # @return tuple A token to give back to stop()
+    def start(self):
+        t = os.times()
+        return (time.time(), t[0] + t[1], StageProfiler.get_maxrss())
+
+    ## Stop measuring a call and record it
+    # @param token The token returned by start()
+    # @param name Name of the module
+    # @param method Name of the method called
+    # @param dictofvars The vars returned by the module (their size will be recorded if memory is enabled)
+    # @param stage True if this record is a whole stage of the workflow (recorded by execute()) instead of a single module call
+    # @param cached True if the output was loaded from the cache instead of being computed
+    def stop(self, token, name, method, dictofvars=None, stage=False, cached=False):
+        (wall, cpu, maxrss) = token
+        t = os.times()
+        record = OrderedDict()
+        record['module'] = name
+        record['method'] = method
+        record['stage'] = stage
+        record['cached'] = cached
+        record['wall'] = time.time() - wall
+        record['cpu'] = t[0] + t[1] - cpu
+        newmaxrss = StageProfiler.get_maxrss()
+        record['maxrss_delta'] = newmaxrss - maxrss if maxrss is not None else None
+        record['vars'] = dict()
+        if self.memory and isinstance(dictofvars, dict):
+            for key, value in dictofvars.iteritems():
+                try:
+                    record['vars'][key] = asizeof.asizeof(value)
+                except Exception:
+                    record['vars'][key] = None
+        captured = getattr(self.local, 'records', None)
+        if captured is not None:
+            captured.append(record)
+        else:
+            self.records.append(record)
+        return record
+
+    ## Call a function and return the records of the module calls it made instead of adding them to the records, so that a background thread never touches the records: the main thread adds them itself (see BaseTextReader.prefetch_texts())
+    # @param func Function to call
+    # @return tuple (return value of the function, list of the records)
+    def capture(self, func, *args, **kwargs):
+        self.local.records = list()
+        try:
+            return (func(*args, **kwargs), self.local.records)
+        finally:
+            self.local.records = None
+
+    ## Aggregate the records by module and method
+    # @return list List of dicts, one per module and method, in the order of their first call
+    def summary(self):
+        summary = OrderedDict()
+        for record in self.records:
+            key = (record['module'], record['method'])
+            if key not in summary:
+                summary[key] = {'module': record['module'], 'method': record['method'], 'calls': 0, 'cached': 0, 'wall': 0.0, 'cpu': 0.0, 'maxrss_delta': 0, 'size': 0}
+            s = summary[key]
+            s['calls'] += 1
+            s['cached'] += int(record['cached'])
+            s['wall'] += record['wall']
+            s['cpu'] += record['cpu']
+            s['maxrss_delta'] += record['maxrss_delta'] or 0
+            s['size'] += sum([size or 0 for size in record['vars'].itervalues()])
+        if not self.memory:
+            for s in summary.itervalues():
+                s['size'] = None # not measured
+        return summary.values()
+
+    ## Print a summary table of the records on the console
+    def print_summary(self):
+        mb = 1024.0 * 1024.0
+        print("Stages profile:")
+        print("%-30s %7s %7s %10s %10s %12s %12s" % ('module', 'calls', 'cached', 'wall (s)', 'cpu (s)', 'peak RSS +MB', 'output MB'))
+        for s in self.summary():
+            print("%-30s %7d %7d %10.2f %10.2f %12.1f %12s" % ('%s.%s' % (s['module'], s['method']), s['calls'], s['cached'], s['wall'], s['cpu'], s['maxrss_delta'] / mb, '%.1f' % (s['size'] / mb) if s['size'] is not None else '-'))
+        sys.stdout.flush()
+
+    ## Save the records and their summary into a json file
+    # @param jsonfile Path to the json file
+    def save(self, jsonfile):
+        try:
+            with open(jsonfile, 'wb') as f:
+                f.write( json.dumps({'summary': self.summary(), 'records': self.records}, indent=4) )
+            return True
+        except Exception, e:
+            print("Exception while trying to save the stages profile into %s: %s" % (jsonfile, e))
+            return False
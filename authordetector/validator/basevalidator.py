@@ -47,6 +47,12 @@ class BaseValidator(BaseClass):
     # Public main method that should be called by Runner
     publicmethod = 'process'
 
+    # Vars returned by the public method (used by the workflow scheduler to find which modules depend on each other)
+    outputvars = ['ValidationScore']
+
+    # Validation is cheap and its scores are printed, so it's not worth caching
+    cacheable = False
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -42,6 +42,9 @@ class Salience(BaseValidator):
         'after': 'detector' # Salience should be computed only after detection
     }
 
+    # Config keys read by this module
+    configkeys = []
+
     ## Constructor
     # @param config An instance of the ConfigParser class
     def __init__(self, config=None, parent=None, *args, **kwargs):
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package test_diskcache
+#
+# Check that a DiskCache can be shared by several threads (run with: python -m unittest discover tests)
+
+import os, sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from authordetector.diskcache import DiskCache
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_threads(self):
+        cache = DiskCache(self.tmpdir, maxsize=20000) # small enough to evict continuously
+        errors = list()
+        def work(n):
+            try:
+                for i in xrange(200):
+                    key = DiskCache.hash([i % 50])
+                    cache.set(key, 'x' * 1000)
+                    cache.get(key)
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=work, args=(n,)) for n in xrange(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.hits + cache.misses, 8 * 200)
+        self.assertTrue(sum([size for (mtime, size, path) in cache.entries()]) <= 20000)
+
+if __name__ == '__main__':
+    unittest.main()
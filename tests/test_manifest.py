@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package test_manifest
+#
+# Check the fingerprint of the JSONL manifests and the error on a missing manifest (run with: python -m unittest discover tests)
+
+import os, sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from authordetector import manifest
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'texts.jsonl')
+        self.write('// texts\n{"file": "A/a0.txt", "author": "A"}\n{"file": "B/b0.txt", "author": "B"}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, content, mtime=None):
+        with open(self.path, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def load(self):
+        m = manifest.Manifest()
+        m.init(configfile=self.path)
+        m.load()
+        return m
+
+    def test_fingerprint_does_not_parse(self):
+        m = self.load()
+        m.config.fingerprint()
+        self.assertEqual(len(m.config), 2)
+        self.assertEqual(m.config.cache, dict())
+
+    def test_fingerprint_changes(self):
+        self.write(open(self.path, 'rb').read(), 1000000)
+        before = self.load().config.fingerprint()
+        self.write('// texts\n{"file": "A/a0.txt", "author": "A"}\n{"file": "B/b0.txt", "author": "B"}\n{"file": "B/b1.txt", "author": "B"}\n', 1000000) # one more text
+        self.assertNotEqual(self.load().config.fingerprint(), before)
+        self.write('// texts\n{"file": "A/a0.txt", "author": "A"}\n{"file": "B/b1.txt", "author": "B"}\n', 1000010) # edited in place
+        self.assertNotEqual(self.load().config.fingerprint(), before)
+
+    def test_missing_manifest(self):
+        m = manifest.Manifest()
+        self.assertRaises(IOError, m.init, configfile=os.path.join(self.tmpdir, 'missing.jsonl'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package test_namespace
+#
+# Check that the modules get the vars they ask for when called by the Runner (run with: python -m unittest discover tests)
+
+import os, sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from authordetector.base import BaseClass
+from authordetector.configparser import ConfigParser
+from authordetector.run import Runner
+
+## Module reading its input through **kwargs
+class KwargsModule(BaseClass):
+    def process(self, *args, **kwargs):
+        return {'Y': [x * 2 for x in kwargs['X']]}
+
+## Module reading only the vars named in its arguments
+class NamedModule(BaseClass):
+    def process(self, X=None, *args, **kwargs):
+        return {'Z': sorted(kwargs.keys())}
+
+class TestNamespace(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ConfigParser()
+        self.config.config = dict()
+        self.runner = Runner()
+        self.runner.config = self.config
+        self.runner.vars = {'X': [1, 2, 3], 'Other': 'foo'}
+
+    def test_kwargs_module(self):
+        self.runner.generic_call(KwargsModule(self.config, self.runner), 'process')
+        self.assertEqual(self.runner.vars['Y'], [2, 4, 6])
+
+    def test_kwargs_module_args(self):
+        out = self.runner.generic_call(KwargsModule(self.config, self.runner), 'process', args={'X': [5]}, return_vars=True)
+        self.assertEqual(out['Y'], [10])
+        self.assertEqual(self.runner.vars['X'], [1, 2, 3])
+
+    def test_kwargs_get_all_vars(self):
+        self.runner.generic_call(NamedModule(self.config, self.runner), 'process')
+        self.assertEqual(self.runner.vars['Z'], ['Other'])
+
+if __name__ == '__main__':
+    unittest.main()
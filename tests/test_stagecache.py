@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package test_stagecache
+#
+# Check that the stages cache is invalidated when a file given in the config is edited, and not when a runtime key changes (run with: python -m unittest discover tests)
+
+import os, sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from authordetector.base import BaseClass
+from authordetector.configparser import ConfigParser
+from authordetector.diskcache import DiskCache
+from authordetector.preprocessor.stopwordsfilter import StopWordsFilter
+from authordetector.reader.basetextreader import BaseTextReader # declares runtime keys, loaded by the Runner in a real run
+from authordetector.run import Runner
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stopwords = os.path.join(self.tmpdir, 'stopwords.txt')
+        with open(self.stopwords, 'wb') as f:
+            f.write('de\nla\nle\n')
+        self.config = ConfigParser()
+        self.config.config = {'stopwordsfilter_file': self.stopwords, 'stopwordsfilter_mode': 'strip'}
+        self.runner = Runner()
+        self.runner.config = self.config
+        self.runner.vars = dict()
+        self.runner.cache = DiskCache(os.path.join(self.tmpdir, 'cache'))
+        self.module = StopWordsFilter(self.config, self.runner)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    ## Key of the output of the stopwords filter for a given text
+    def key(self):
+        return self.runner.stage_key(self.module, 'process', {'Text': 'le chat de la maison'})
+
+    def test_same_file_hits(self):
+        self.runner.cache.set(self.key(), {'Text': 'chat maison'})
+        self.assertTrue(self.key() in self.runner.cache)
+
+    def test_edited_file_misses(self):
+        self.runner.cache.set(self.key(), {'Text': 'chat maison'})
+        # Edit the stopwords file at the same path
+        with open(self.stopwords, 'wb') as f:
+            f.write('chat\nmaison\n')
+        st = os.stat(self.stopwords)
+        os.utime(self.stopwords, (st.st_atime, st.st_mtime + 10)) # make sure the modification time changes, whatever the resolution of the filesystem
+        self.assertFalse(self.key() in self.runner.cache)
+        self.assertEqual(self.runner.cache.get(self.key()), None)
+        self.assertEqual(self.runner.cache.misses, 1)
+
+    def test_runtime_keys_ignored(self):
+        module = BaseClass(self.config, self.runner) # configkeys is None: reads the whole config
+        values = module.get_config_values()
+        # Runtime keys declared by the Runner and by another module
+        self.config.config.update({'debug': True, 'reader_prefetch': 4, 'parallel_workers': 2})
+        self.assertEqual(module.get_config_values(), values)
+        # Other keys change the values
+        self.config.config['ngrams_number'] = 3
+        self.assertNotEqual(module.get_config_values(), values)
+
+if __name__ == '__main__':
+    unittest.main()
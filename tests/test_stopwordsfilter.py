@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+#
+# AuthorDetector
+# Copyright (C) 2013 Larroque Stephen
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+## @package test_stopwordsfilter
+#
+# Check the stopwords filter on non-ascii texts and stopwords (run with: python -m unittest discover tests)
+
+import os, sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from authordetector.configparser import ConfigParser
+from authordetector.preprocessor.stopwordsfilter import StopWordsFilter
+
+class TestStopWordsFilter(unittest.TestCase):
+
+    text = 'Là, le café était déjà froid et çà et là des miettes.'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.stopwords = os.path.join(self.tmpdir, 'stopwords.txt')
+        with open(self.stopwords, 'wb') as f:
+            f.write('là\nle\nétait\ndéjà\net\nçà\ndes\n')
+        self.config = ConfigParser()
+        self.config.config = {'stopwordsfilter_file': self.stopwords, 'stopwordsfilter_mode': 'strip', 'reader_charset': 'utf-8'}
+        self.module = StopWordsFilter(self.config)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_strip(self):
+        out = self.module.process(Text=self.text)['Text']
+        self.assertTrue(isinstance(out, str))
+        self.assertEqual(out.split(), [',', 'café', 'froid', 'miettes.'])
+
+    def test_keep(self):
+        self.config.config['stopwordsfilter_mode'] = 'keep'
+        out = self.module.process(Text=self.text)['Text']
+        self.assertTrue(isinstance(out, str))
+        self.assertEqual(out, 'Là le était déjà et çà et là des')
+
+    def test_unicode_input(self):
+        out = self.module.process(Text=self.text.decode('utf-8'))['Text']
+        self.assertTrue(isinstance(out, str))
+        self.assertEqual(out, self.module.process(Text=self.text)['Text'])
+        str(' '.join(out.split())) # as NGrams does with the words
+
+    def test_stream(self):
+        blocks = [self.text[i:i+7] for i in xrange(0, len(self.text), 7)] # some blocks end in the middle of a multibyte character
+        out = ''.join(self.module.stream(iter(blocks)))
+        self.assertTrue(isinstance(out, str))
+        self.assertEqual(out, self.module.process(Text=self.text)['Text'])
+
+if __name__ == '__main__':
+    unittest.main()